@@ -0,0 +1,287 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Benchmarks for wat.py.
+
+    # everything, or any of: backends kernel ordinality reduce shards
+    $ python bench.py
+    $ python bench.py reduce
+
+    # save the numbers, then compare a later run against them
+    $ python bench.py --json base.json
+    $ python bench.py --baseline base.json
+
+Results are flat name -> number; names ending in _s are times (lower is
+better), names ending in _per_s are rates (higher is better).
+Backends are measured against Stub, a stand-in interpreter that is just
+this python speaking wat.Resident's framing, so nothing but python has to
+be installed; the real backends are measured as well where their
+interpreters are found.
+"""
+
+import os, re, sys, time, random, json, tempfile, argparse
+import subprocess
+import networkx as nx
+import wat
+
+class Stub(wat.Resident):
+    name = 'stub'
+    longname = 'Stub'
+    executable = sys.executable
+    cmd = ['-c']
+    version_cmd = 'echo stub'
+    driver = r"""
+import sys
+while True:
+    header = sys.stdin.readline()
+    if not header:
+        break
+    code = sys.stdin.read(int(header[1:]))
+    kind = ''
+    try:
+        out = repr(eval(code, {}))
+    except Exception as e:
+        kind, out = type(e).__name__, str(e)
+    sys.stdout.write('\x01%d %s\n%s' % (len(out), kind, out))
+    sys.stdout.flush()
+"""
+    def parse(self, output):
+        if output == 'True' or output == 'False':
+            return wat.Bool(output)
+        return wat.Undecided(output)
+    def true(self): return wat.Bool('True')
+    def operands(self):
+        return [wat.Value(wat.Types.UNKNOWN, v) for v in
+            'None True False 0 1 -1 0.0 1.5 -2.5 "" "a" "b" () (1,) [] [0] {} 1j'.split()]
+
+# expressions that fail in each language; anything else gets this
+error_exprs = {'pl': '1/0', 'default': 'wat_undefined'}
+
+def timed(f, *args, **kwargs):
+    start = time.time()
+    f(*args, **kwargs)
+    return time.time() - start
+
+def stop(lang):
+    try:
+        lang.proc.kill()
+        lang.proc.wait()
+    except OSError:
+        pass
+
+def respawn(lang):
+    stop(lang)
+    lang.spawn()
+
+def quietly(f, *args, **kwargs):
+    # ordinality() and friends print as they go
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        return f(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+
+def bench_backends(results, repeat=3, n=5000):
+    for cls in [Stub, wat.Python, wat.Javascript, wat.Ruby, wat.Perl, wat.PHP]:
+        key = 'backend.%s.' % cls.name
+        try:
+            starts = []
+            for _ in xrange(repeat):
+                start = time.time()
+                lang = cls()
+                lang.run('1 + 1')
+                starts.append(time.time() - start)
+                stop(lang)
+        except Exception, e:
+            print '%-5s skipped: %s' % (cls.name, e)
+            continue
+        lang = cls()
+        results[key + 'startup_s'] = min(starts)
+        codes = ['%d + %d' % (i, i) for i in xrange(n)]
+        results[key + 'exprs_per_s'] = n / timed(lang.run_many, codes)
+        codes = [error_exprs.get(cls.name, error_exprs['default'])] * n
+        results[key + 'errors_per_s'] = n / timed(lang.run_many, codes)
+        restart = getattr(lang, 'restart', None) or (lambda: respawn(lang))
+        # spawn() doesn't wait for the interpreter, so up to its first answer
+        def restarted():
+            restart()
+            lang.run('1 + 1')
+        results[key + 'restart_s'] = min(timed(restarted) for _ in xrange(repeat))
+        stop(lang)
+
+def bench_ordinality(results):
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='wat-bench-'))
+    try:
+        for cls in [Stub, wat.Python]:
+            key = 'ordinality.%s.' % cls.name
+            try:
+                lang = cls()
+            except Exception, e:
+                print '%-5s skipped: %s' % (cls.name, e)
+                continue
+            store = wat.ResultStore('%s.db' % cls.name)
+            results[key + 'cold_s'] = timed(quietly, wat.ordinality, lang, store=store, render=False)
+            results[key + 'cached_s'] = timed(quietly, wat.ordinality, lang, store=store, render=False)
+            store = wat.ResultStore('%s.sort.db' % cls.name)
+            results[key + 'sort_cold_s'] = timed(quietly, wat.ordinality, lang, store=store,
+                                                 strategy='sort', render=False)
+            stop(lang)
+    finally:
+        os.chdir(cwd)
+
+def bench_kernel(results):
+    # the whole operations() table, in-interpreter against row by row
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='wat-bench-'))
+    try:
+        for cls in [wat.Python, wat.Javascript]:
+            key = 'kernel.%s.' % cls.name
+            try:
+                lang = cls()
+                lang.proc # started when first used, so start it here
+            except Exception, e:
+                print '%-5s skipped: %s' % (cls.name, e)
+                continue
+            n = wat.count_operations(lang)
+            results[key + 'exprs_per_s'] = n / timed(wat.operation_matrix, lang)
+            lang.kernel = lambda *args: None
+            results[key + 'rows_exprs_per_s'] = n / timed(wat.operation_matrix, lang)
+            stop(lang)
+    finally:
+        os.chdir(cwd)
+
+def reduce_edges_pairwise(G):
+    # what graphviz() did before reduce_edges(); kept as the baseline
+    for x, y in G.edges():
+        existing = [
+            s for s in G.successors(x)
+                if s != x and s != y and nx.has_path(G, s, y) ]
+        if existing:
+            G.remove_edge(x, y)
+            if not nx.has_path(G, x, y):
+                G.add_edge(x, y)
+
+def synthetic(n, degree=8, cycles=0.02, seed=0):
+    # looks like an ordinality graph: mostly "x > y" edges down a ranking,
+    # with a few edges back up it to make cycles
+    rand = random.Random(seed)
+    G = nx.DiGraph()
+    G.add_nodes_from(xrange(n))
+    for x in xrange(n - 1):
+        for _ in xrange(degree):
+            G.add_edge(x, rand.randint(x + 1, min(n - 1, x + 4 * degree)))
+        if rand.random() < cycles:
+            G.add_edge(x, rand.randint(max(0, x - 4 * degree), x))
+    G.remove_edges_from([(x, x) for x in G.nodes()])
+    return G
+
+def bench_reduce(results, sizes=(250, 500, 1000, 2000, 4000), pairwise_max=1000):
+    for n in sizes:
+        key = 'reduce.%d.' % n
+        G = synthetic(n)
+        H = G.copy()
+        results[key + 'reduce_edges_s'] = timed(wat.reduce_edges, H)
+        if n <= pairwise_max:
+            P = G.copy()
+            results[key + 'pairwise_s'] = timed(reduce_edges_pairwise, P)
+            if set(P.edges()) != set(H.edges()):
+                print 'reduce: edges differ at %d nodes' % n
+
+def differing(a, b):
+    # the cells of two ResultMatrix that disagree, memory addresses aside
+    if (a.operands, a.ops) != (b.operands, b.ops):
+        raise Exception('differing: not the same operands and operators')
+    def cell(m, i):
+        code = m.at(i)
+        out = m.output(code)
+        return code if out is None else re.sub(r'0x[0-9a-fA-F]+', '0x', out)
+    return [i for i in xrange(len(a.operands) ** 2 * len(a.ops)) if cell(a, i) != cell(b, i)]
+
+def bench_shards(results, shards=3):
+    # a run split into shards, each in a process and directory of its own as
+    # it would be on separate machines, then merged, against the same run in
+    # one go; the merged matrices have to match the serial ones, but for
+    # results that show memory addresses
+    script = os.path.splitext(os.path.abspath(wat.__file__))[0] + '.py'
+    base = tempfile.mkdtemp(prefix='wat-bench-')
+    devnull = open(os.devnull, 'w')
+    def start(d, *args):
+        return subprocess.Popen([sys.executable, script, '-o', d, '-x', 'py=' + sys.executable,
+                                 '--no-render'] + list(args), stdout=devnull, stderr=devnull)
+    for mode, suffix in [('ordinality', '.ord.matrix'), ('matrix', '.ops.matrix')]:
+        key = 'shards.%s.' % mode
+        serial = os.path.join(base, mode, 'serial')
+        dirs = [os.path.join(base, mode, 'shard%d' % i) for i in xrange(shards)]
+        merged = os.path.join(base, mode, 'merged')
+        began = time.time()
+        if start(serial, '-m', mode).wait():
+            print 'shards: %s serial run failed' % mode
+            continue
+        results[key + 'serial_s'] = time.time() - began
+        began = time.time()
+        procs = [start(d, '-m', mode, '--shard', '%d/%d' % (i, shards))
+                     for i, d in enumerate(dirs)]
+        if [p.wait() for p in procs] != [0] * shards or \
+                start(merged, '-m', 'merge', '--from', *dirs).wait():
+            print 'shards: %s sharded run or merge failed, in %s' % (mode, base)
+            continue
+        results[key + 'sharded_s'] = time.time() - began
+        for name in os.listdir(serial):
+            if name.endswith(suffix):
+                a = wat.ResultMatrix.load(os.path.join(serial, name))
+                b = wat.ResultMatrix.load(os.path.join(merged, name))
+                # x ? x compares two objects made just then, and python 2
+                # orders those it can't compare by address; where they land
+                # depends on what ran before, which a shard changes
+                n, ops = len(a.operands), len(a.ops)
+                bad = [i for i in differing(a, b) if i // (n * ops) != i % n]
+                if bad:
+                    print 'shards: %s differs from the serial run in %d of %d cells' % (
+                        name, len(bad), n * n * ops)
+
+def compare(results, baseline, tolerance=0.1):
+    # returns the names that got worse by more than tolerance
+    worse = []
+    for name in sorted(set(results) & set(baseline)):
+        new, old = results[name], baseline[name]
+        ratio = new / old if old else float('inf')
+        if name.endswith('_per_s'):
+            bad = ratio < 1 - tolerance
+        else:
+            bad = ratio > 1 + tolerance
+        if bad:
+            worse.append(name)
+        print '%-40s %12.4f %12.4f %7.2fx%s' % (name, old, new, ratio, '  WORSE' if bad else '')
+    return worse
+
+benches = {
+    'backends': bench_backends,
+    'kernel': bench_kernel,
+    'ordinality': bench_ordinality,
+    'reduce': bench_reduce,
+    'shards': bench_shards,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark wat.py')
+    parser.add_argument('benches', nargs='*', choices=sorted(benches) + [[]],
+                        help='which benchmarks to run (default: all)')
+    parser.add_argument('--json', help='write results here')
+    parser.add_argument('--baseline', help='compare against results saved with --json')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='how much worse than the baseline counts as a regression')
+    args = parser.parse_args()
+    results = {}
+    for name in args.benches or sorted(benches):
+        benches[name](results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = compare(results, json.load(f), args.tolerance)
+        sys.exit(1 if worse else 0)
+    for name in sorted(results):
+        print '%-40s %12.4f' % (name, results[name])
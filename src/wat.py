@@ -18,6 +18,9 @@ For Lang(Python) we'd generate py.out.dot, which can be transformed into a graph
     $ ls *.png
 js.ord.png  py.ord.png
 
+    # or pick the languages, what to do with them and where to put it
+    $ python wat.py py rb --mode scan --workers 4 -o out/
+    $ python wat.py --help
 
 """
 
@@ -44,11 +47,18 @@ js.ord.png  py.ord.png
  24228 print"-"               php -1                     py -                      rb -
 """
 
-import os, re
+import os, re, time, random, math, atexit, argparse
+from contextlib import contextmanager
 import networkx as nx
 import json
+import array, mmap, struct
+import heapq
+import sqlite3
 import subprocess
-from subprocess import Popen, PIPE
+import threading, Queue, traceback
+import select, fcntl, errno
+import pipes
+from subprocess import Popen, PIPE, STDOUT
 
 class Types:
     UNKNOWN     = 0 # didn't even try
@@ -72,17 +82,181 @@ class Types:
 class Lang:
     name = 'FIXME'
     err_substrs = ['Error']
-    def run(code): raise Exception('override me!')
+    batch_size = 1
+    # the interpreter to run; version_cmd gets it as %(exe)s
+    executable = ''
+    version_cmd = ''
+    timeout = 5 # seconds an expression gets before its interpreter is restarted
+    # nothing is started when a backend is made; the interpreter is spawned
+    # (spawn() sets self.proc), and asked its version, the first time
+    # something needs them. family is the language, which is the name but
+    # for backends made by versions()
+    def __getattr__(self, attr):
+        if attr == 'proc':
+            self.spawn()
+        elif attr == 'version':
+            self.version = os.popen(self.version_cmd % {
+                'exe': pipes.quote(self.executable)}).readline().strip()
+        elif attr == 'family':
+            self.family = self.name
+        else:
+            raise AttributeError(attr)
+        return self.__dict__[attr]
+    # every backend is an interpreter we talk to in frames (see Channel):
+    # spawn() starts it and sets self.proc and self.channel, send() asks it
+    # to evaluate a list of expressions, and it answers with a frame each
+    def spawn(self): raise Exception('override me!')
+    def send(self, codes): raise Exception('override me!')
+    def run(self, code):
+        return self.run_many([code])[0]
+    def run_many(self, codes):
+        return drive([self], codes)
+    def restart(self):
+        # only for an interpreter that has died or stopped answering; errors
+        # in the expressions themselves never get this far
+        stats.count(self.name, 'restarts')
+        try:
+            self.proc.kill()
+        except OSError:
+            pass
+        self.proc.wait()
+        self.spawn()
+    def close(self):
+        if 'proc' in self.__dict__:
+            try:
+                self.proc.kill()
+            except OSError:
+                pass
+            self.proc.wait()
+            del self.proc
+    def frames(self, n, timeout):
+        # the next n frames, each within timeout seconds of the last; an
+        # interpreter that dies or runs over is restarted and Crash raised
+        for _ in xrange(n):
+            try:
+                yield self.channel.wait(time.time() + timeout)
+            except Crash:
+                self.restart()
+                raise
     @classmethod
     def is_err(cls, msg):
+        if isinstance(msg, Output):
+            return isinstance(msg, Failure)
         for e in cls.err_substrs:
             if e in msg:
                 return True
         return False
     def is_nop(self, msg): return msg == ''
-
-class PHP(Lang):
+    def parse(self, output): return Undecided(output)
+    # the output as a Value: of the type the backend gave it (see Output),
+    # or, from backends that don't say, whatever can be made of the text
+    def value(self, output):
+        if getattr(output, 'type', Types.UNKNOWN) != Types.UNKNOWN:
+            return Value(output.type, str(output))
+        if self.is_err(output):
+            return Value(Types.ERR_RUN, output)
+        return self.parse(output)
+    # the relations ordinality() looks at; backends that can evaluate all of
+    # them for a pair in one expression return that expression from
+    # relations() and decode its output with parse_relations()
+    relation_ops = ['>', '==', '<', '!=', '<=', '>=']
+    def relations(self, x, y): return None
+    def parse_relations(self, output): return None
+    # backends that can work out the whole operations() table inside the
+    # interpreter return an iterator over its rows, from row `start` on
+    # (every `step`th), each as (new output values, codes); see
+    # operation_matrix(). names are what the operands are bound to (see
+    # ref()), refs what an expression calls them by (see reference()); each
+    # operator is compiled once and called on the bound operands
+    def kernel(self, operands, names, refs, unary, binary, start=0, step=1): return None
+    # backends that can (binds) have each operand evaluated once when the
+    # interpreter starts, and bound to a short name; expressions then use
+    # the name (see bound()) rather than sending the source and evaluating
+    # it every time. bindings maps source to name, for those that could be
+    # bound, and names maps them back
+    binds = False
+    bindings = {}
+    names = {}
+    def bind(self):
+        if not self.binds:
+            return
+        sources = [str(x) for x in self.operands()]
+        names = ['_w%d' % i for i in xrange(len(sources))]
+        self.send_bindings(names, sources)
+        done = set(json.loads(self.channel.wait(time.time() + self.timeout)))
+        self.bindings = dict((x, name) for x, name in zip(sources, names) if name in done)
+        self.names = dict((name, x) for x, name in self.bindings.items())
+    def ref(self, x):
+        if not self.binds:
+            return str(x)
+        self.proc # started, and so bound
+        return self.bindings.get(str(x), str(x))
+    def unbind(self, output):
+        # output (an error message, mostly) with any bound name it quotes
+        # put back as the operand's source, so it reads as the expression did
+        if not self.names or '_w' not in output:
+            return output
+        def put(m):
+            x = self.names.get(m.group(2))
+            return m.group(0) if x is None else source(x) if m.group(1) else x
+        text = re.sub(r'(\()?\b(_w\d+)\b(?(1)\))', put, output)
+        if isinstance(output, Failure):
+            return type(output)(text, output.kind)
+        if isinstance(output, Output):
+            return Output(text, output.type)
+        return text
+    # an expression naming the type of x, for backends that can say; see
+    # equivalence_classes()
+    def kind(self, x): return None
+    # an expression that makes about n objects and leaves the heap other
+    # than it found it, so that what's allocated after lands elsewhere (see
+    # resample()); for backends whose results can show where things land
+    def ballast(self, n): return None
+    # an expression that is true when every link of a chain x0 op0 x1 op1
+    # x2 ... holds; languages that chain comparisons natively say so
+    # (python's a < b < c), the rest get a conjunction
+    def chain(self, terms, ops):
+        return ' && '.join('(%s %s %s)' % (x, op, y)
+                           for x, op, y in zip(terms, ops, terms[1:]))
+
+class Resident(Lang):
+    # a long-lived interpreter running `driver`, which reads framed
+    # expressions on stdin, evaluates each in isolation and writes back
+    # framed output; see write_frame/Channel
+    cmd = []
+    driver = ''
+    batch_size = 100 # small enough that neither pipe fills while we write
+    def spawn(self):
+        self.proc = Popen([self.executable] + self.cmd + [self.driver], stdin=PIPE,
+                          stdout=PIPE, stderr=STDOUT, close_fds=True, bufsize=-1)
+        self.channel = Channel(self.proc.stdout)
+    def send(self, codes):
+        for code in codes:
+            write_frame(self.proc.stdin, wire(code))
+        self.proc.stdin.flush()
+
+class Workers:
+    # N independent instances of one backend. run_many() shards the work
+    # across them in batch_size chunks and puts the results back in order,
+    # so callers can't tell it apart from a single instance. each worker's
+    # interpreter starts the first time it's given work, and drive() keeps
+    # all of them busy from the one thread
+    def __init__(self, cls, n):
+        self.workers = [cls() for _ in xrange(n)]
+    def __getattr__(self, attr):
+        # operands(), true(), name, version... are the same for every worker
+        return getattr(self.workers[0], attr)
+    def run(self, code):
+        return self.workers[0].run(code)
+    def run_many(self, codes):
+        return drive(self.workers, codes)
+    def close(self):
+        for w in self.workers:
+            w.close()
+
+class PHP(Resident):
     name = 'php'
+    longname = 'PHP'
     err_substrs = [
         'Parse error',
         'Use of undefined',
@@ -91,16 +265,45 @@ class PHP(Lang):
         'PHP Notice:',
         'PHP Fatal error:',
     ]
-    @staticmethod
-    def run(code):
-        with open('foo.php', 'w') as f:
-            f.write("<?php\necho " + code + ';')
-        with os.popen('php -q foo.php 2>&1 | grep -v "PHP Startup:"') as p:
-            output = p.readline()
-        return output.strip()
-
-class Ruby(Lang):
+    executable = 'php'
+    version_cmd = '%(exe)s -v 2>/dev/null | head -1 | cut -d" " -f2'
+    cmd = ['-q', '-d', 'display_startup_errors=0', '-r']
+    # errors are reported the way the php cli prints them, so err_substrs
+    # still apply; each expression is eval'd inside a function so that no
+    # variables leak from one to the next
+    driver = r"""
+function wat_error($no, $msg) {
+    $kind = array(E_WARNING => 'Warning', E_NOTICE => 'Notice');
+    echo 'PHP ' . (isset($kind[$no]) ? $kind[$no] : 'Error') . ': ' . $msg . "\n";
+    return true;
+}
+function wat_eval($wat_code) {
+    set_time_limit(1);
+    try {
+        eval('echo ' . $wat_code . ';');
+    } catch (ParseError $e) {
+        echo 'PHP Parse error: ' . $e->getMessage();
+    } catch (Throwable $e) {
+        echo 'PHP Fatal error: ' . $e->getMessage();
+    }
+}
+set_error_handler('wat_error');
+while (($header = fgets(STDIN)) !== false) {
+    $n = (int)substr($header, 1);
+    $code = '';
+    while (strlen($code) < $n && !feof(STDIN))
+        $code .= fread(STDIN, $n - strlen($code));
+    ob_start();
+    wat_eval($code);
+    $out = ob_get_clean();
+    echo "\x01" . strlen($out) . "\n" . $out;
+    fflush(STDOUT);
+}
+"""
+
+class Ruby(Resident):
     name = 'rb'
+    longname = 'Ruby'
     err_substrs = [
         'foo.rb:1',
         'syntax error',
@@ -112,16 +315,44 @@ class Ruby(Lang):
         'formal argument cannot be a constant',
         'wrong number of arguments',
     ]
-    @staticmethod
-    def run(code):
-        with open('foo.rb', 'w') as f:
-            f.write('print ' + code)
-        with os.popen('timeout 1 ruby foo.rb 2>&1') as p:
-            output = p.readline().strip()
-        return output.strip()
-
-class Perl(Lang):
+    executable = 'ruby'
+    version_cmd = '%(exe)s --version | cut -d" " -f2'
+    def kind(self, x): return '(%s).class' % x
+    def parse(self, output):
+        if output == 'true' or output == 'false':
+            return Bool(output)
+        return Undecided(output)
+    cmd = ['-e']
+    # expressions are still labelled foo.rb:1 so errors read as they did when
+    # we ran a file per expression; each one gets a fresh binding
+    driver = r"""
+require 'stringio'
+require 'timeout'
+STDOUT.sync = true
+while (header = STDIN.gets)
+  code = STDIN.read(header[1..-1].to_i)
+  out = StringIO.new
+  $stdout = out
+  begin
+    Timeout.timeout(1) { eval('print ' + code, Object.new.instance_eval { binding }, 'foo.rb', 1) }
+  rescue Exception => e
+    msg = e.message.lines.first.to_s.chomp
+    # where in foo.rb it went wrong, even from inside a library (a timeout
+    # is raised in timeout.rb), so that err_substrs catch it
+    where = (e.backtrace || []).find { |line| line.start_with?('foo.rb') } || 'foo.rb:1'
+    msg = "#{where}: #{msg} (#{e.class})" unless e.is_a?(SyntaxError)
+    out.print msg
+  ensure
+    $stdout = STDOUT
+  end
+  s = out.string
+  STDOUT.write("\x01#{s.bytesize}\n#{s}")
+end
+"""
+
+class Perl(Resident):
     name = 'pl'
+    longname = 'Perl'
     err_substrs = [
         'syntax error',
         'Search pattern not terminated',
@@ -133,14 +364,40 @@ class Perl(Lang):
         'Unmatched )',
         'No comma allowed',
         'is no longer supported',
+        'wat timed out',
     ]
-    @staticmethod
-    def run(code):
-        with open('foo.pl', 'w') as f:
-            f.write('print ' + code)
-        with os.popen('timeout 1 perl foo.pl 2>&1') as p:
-            output = p.readline()
-        return output.strip()
+    executable = 'perl'
+    version_cmd = "%(exe)s -e 'print $]'"
+    cmd = ['-e']
+    # each expression is compiled in a package of its own and print is
+    # pointed at a string for the duration; a timeout dies with something
+    # err_substrs catch
+    driver = r"""
+$| = 1;
+my $n = 0;
+while (defined(my $header = <STDIN>)) {
+    read(STDIN, my $code, substr($header, 1));
+    my $out = '';
+    open(my $fh, '>', \$out);
+    my $stdout = select($fh);
+    $n++;
+    eval {
+        local $SIG{ALRM} = sub { die "wat timed out\n" };
+        alarm 1;
+        eval "package wat$n; print $code";
+        alarm 0;
+        die $@ if $@;
+    };
+    select($stdout);
+    close($fh);
+    if ($@) {
+        # as perl -e said it, not with this loop's eval and line counts
+        (my $err = $@) =~ s/\(eval \d+\) line (\d+)(, <STDIN> line \d+)?/-e line $1/g;
+        $out .= $err;
+    }
+    print "\x01" . length($out) . "\n" . $out;
+}
+"""
 
 class Value:
     def __init__(self, type, val):
@@ -153,11 +410,13 @@ class Value:
     def __hash__(self):
         return self.val.__hash__()
     def __eq__(self, other):
-        if type(other) == type(''):
+        if isinstance(other, str):
             return self.val == other
         elif type(other) == type(self):
             return self.type == other.type and self.val == other.val
         return False
+    def __ne__(self, other):
+        return not self == other
 
 class Unknown(Value):
     def __init__(self, val):
@@ -221,29 +480,158 @@ class Python(Lang):
 
     name = 'py'
     longname = 'Python'
-    version = ''
     prelude = \
         "import sys\n" + \
         "class ClassA: pass\n\n" + \
         "class ClassB: pass\n\n"
-
-    def __init__(self):
-        self.version = os.popen('python --version 2>&1 | cut -d" " -f2').readline().strip()
-        self.proc = Popen('python -i 2>&1', shell=True, stdin=PIPE, stdout=PIPE, close_fds=True)
-        print >> self.proc.stdin, self.prelude + '\n\n'
-
-    def run(self, code):
-        print >> self.proc.stdin, 'eval("%s")\n' % esc(code)
-        output = self.proc.stdout.readline()
-        while output.startswith('Python ') or output.startswith('Type "help"') or output.startswith('[GCC '):
-            output = self.proc.stdout.readline()
-        if 'Traceback (most recent call last):' in output:
-            output = 'Error'
-            self.proc.kill()
-            self.proc = Popen('python -i 2>&1', shell=True, stdin=PIPE, stdout=PIPE, close_fds=True)
-            print >> self.proc.stdin, self.prelude + '\n\n'
-        output = re.sub('>>> ', '', output.strip())
-        return output
+    # evaluate a whole list of expressions per round trip; each result is
+    # written as a frame (see Channel) so we never have to guess where one
+    # result ends and the next begins, and each says what type of thing the
+    # result was (__wat_type gives the Types code). exceptions are caught
+    # here and sent back as error frames, so the interpreter outlives them;
+    # anything that runs past the alarm is interrupted the same way. __wat_matrix is the
+    # kernel (see operation_matrix): the whole table worked out in here, one
+    # frame of codes per row. __wat_bind binds the operands (see Lang.bind)
+    harness = \
+        "import signal, traceback\n" + \
+        "class WatTimeout(Exception): pass\n\n" + \
+        "def __wat_alarm(*args): raise WatTimeout('timed out')\n\n" + \
+        "signal.signal(signal.SIGALRM, __wat_alarm)\n" + \
+        "import operator\n" + \
+        "def __wat_relations(x, y):\n" + \
+        "    r = []\n" + \
+        "    for op in (operator.gt, operator.eq, operator.lt, operator.ne, operator.le, operator.ge):\n" + \
+        "        try:\n" + \
+        "            r.append(op(x, y))\n" + \
+        "        except Exception:\n" + \
+        "            r.append(None)\n" + \
+        "    return tuple(r)\n\n" + \
+        "def __wat_frame(out, kind='', type=0):\n" + \
+        "    if not isinstance(out, bytes): out = out.encode('utf-8', 'replace')\n" + \
+        "    stdout = getattr(sys.stdout, 'buffer', sys.stdout)\n" + \
+        "    stdout.write(('\\x01%d %s %d\\n' % (len(out), kind, type)).encode('ascii') + out)\n" + \
+        "    stdout.flush()\n\n" + \
+        "import numbers, types\n" + \
+        "try:\n" + \
+        "    from collections.abc import Sequence, Set, Mapping\n" + \
+        "except ImportError:\n" + \
+        "    from collections import Sequence, Set, Mapping\n\n" + \
+        "def __wat_type(r):\n" + \
+        "    if r is None: return 6\n" + \
+        "    if isinstance(r, bool): return 7\n" + \
+        "    if isinstance(r, numbers.Integral): return 8\n" + \
+        "    if isinstance(r, float): return 9\n" + \
+        "    if isinstance(r, complex): return 10\n" + \
+        "    if isinstance(r, (Sequence, bytearray)): return 11\n" + \
+        "    if isinstance(r, (Set, Mapping)): return 12\n" + \
+        "    if r is NotImplemented or r is Ellipsis: return 5\n" + \
+        "    if isinstance(r, type) or type(r).__name__ == 'classobj':\n" + \
+        "        builtin = getattr(r, '__module__', '') in ('__builtin__', 'builtins')\n" + \
+        "        return 5 if builtin and not issubclass(r, BaseException) else 14\n" + \
+        "    if isinstance(r, types.ModuleType): return 16\n" + \
+        "    if callable(r): return 13\n" + \
+        "    return 15\n\n" + \
+        "def __wat_batch(codes):\n" + \
+        "    for code in codes:\n" + \
+        "        kind = ''\n" + \
+        "        try:\n" + \
+        "            signal.alarm(1)\n" + \
+        "            r = eval(code, globals())\n" + \
+        "            out = '' if r is None else repr(r)\n" + \
+        "            t = __wat_type(r)\n" + \
+        "            signal.alarm(0)\n" + \
+        "        except BaseException as e:\n" + \
+        "            signal.alarm(0)\n" + \
+        "            kind = type(e).__name__\n" + \
+        "            out = ''.join(traceback.format_exception_only(type(e), e)).strip()\n" + \
+        "        __wat_frame(out, kind, 0 if kind else t)\n\n" + \
+        "import json\n" + \
+        "def __wat_compile(src):\n" + \
+        "    try:\n" + \
+        "        return eval(src, globals())\n" + \
+        "    except BaseException:\n" + \
+        "        return None\n\n" + \
+        "def __wat_matrix(operands, names, refs, unary, binary, start, step):\n" + \
+        "    values = {}\n" + \
+        "    rows = [(-1, op) for op in unary] + [(i, op) for i in range(len(operands)) for op in binary]\n" + \
+        "    ones = dict((op, __wat_compile('lambda b: (' + op + ' b)')) for op in unary)\n" + \
+        "    twos = dict((op, __wat_compile('lambda a, b: (a ' + op + ' b)')) for op in binary)\n" + \
+        "    bound = [name in globals() for name in names]\n" + \
+        "    vals = [globals().get(name) for name in names]\n" + \
+        "    for i, op in rows[start::step]:\n" + \
+        "        fresh, codes = [], []\n" + \
+        "        f = ones[op] if i < 0 else twos[op]\n" + \
+        "        for j, y in enumerate(refs):\n" + \
+        "            try:\n" + \
+        "                signal.alarm(1)\n" + \
+        "                if f and bound[j] and i < 0: r = f(vals[j])\n" + \
+        "                elif f and bound[j] and i != j and bound[i]: r = f(vals[i], vals[j])\n" + \
+        "                elif i < 0: r = eval(op + ' ' + y, globals())\n" + \
+        "                elif i == j: r = eval(operands[i] + ' ' + op + ' ' + operands[j], globals())\n" + \
+        "                else: r = eval(refs[i] + ' ' + op + ' ' + y, globals())\n" + \
+        "                signal.alarm(0)\n" + \
+        "            except BaseException:\n" + \
+        "                signal.alarm(0)\n" + \
+        "                codes.append(1)\n" + \
+        "                continue\n" + \
+        "            if r is None: codes.append(2)\n" + \
+        "            elif r is True: codes.append(3)\n" + \
+        "            elif r is False: codes.append(4)\n" + \
+        "            else:\n" + \
+        "                out = repr(r)\n" + \
+        "                if out not in values:\n" + \
+        "                    values[out] = len(values) + 5\n" + \
+        "                    fresh.append(out)\n" + \
+        "                codes.append(values[out])\n" + \
+        "        __wat_frame(json.dumps([fresh, codes]))\n\n" + \
+        "def __wat_bind(names, sources):\n" + \
+        "    bound = []\n" + \
+        "    for name, source in zip(names, sources):\n" + \
+        "        try:\n" + \
+        "            signal.alarm(1)\n" + \
+        "            globals()[name] = eval(source, globals())\n" + \
+        "            signal.alarm(0)\n" + \
+        "            bound.append(name)\n" + \
+        "        except BaseException:\n" + \
+        "            signal.alarm(0)\n" + \
+        "    __wat_frame(json.dumps(bound))\n\n" + \
+        "sys.ps1 = sys.ps2 = ''\n" + \
+        "sys.stdout.write('__wat_ready__\\n'); sys.stdout.flush()\n"
+    batch_size = 1000
+    executable = 'python'
+    version_cmd = '%(exe)s --version 2>&1 | cut -d" " -f2'
+
+    def spawn(self):
+        self.proc = Popen([self.executable, '-i'], stdin=PIPE, stdout=PIPE, stderr=STDOUT,
+                          close_fds=True, bufsize=-1)
+        self.channel = Channel(self.proc.stdout)
+        print >> self.proc.stdin, self.prelude + '\n\n' + self.harness
+        self.proc.stdin.flush()
+        # skip the banner once, here, rather than on every run()
+        self.channel.skip('__wat_ready__\n', time.time() + self.timeout)
+        self.bind()
+
+    binds = True
+    def send_bindings(self, names, sources):
+        print >> self.proc.stdin, '__wat_bind(%r, %r)\n' % (names, sources)
+        self.proc.stdin.flush()
+
+    def send(self, codes):
+        print >> self.proc.stdin, '__wat_batch(%r)\n' % ([wire(code) for code in codes],)
+        self.proc.stdin.flush()
+
+    def kernel(self, operands, names, refs, unary, binary, start=0, step=1):
+        # __wat_matrix does the work; codes as in ResultMatrix, with outputs
+        # numbered in the order the harness first saw them. a row gets as
+        # long as its expressions would have between them
+        if self.proc.poll() is not None:
+            self.restart()
+        print >> self.proc.stdin, '__wat_matrix(%r, %r, %r, %r, %r, %d, %d)\n' % (
+            operands, names, refs, unary, binary, start, step)
+        self.proc.stdin.flush()
+        rows = len(xrange(start, len(unary) + len(operands) * len(binary), step))
+        for row in self.frames(rows, self.timeout * len(operands)):
+            yield json.loads(row)
 
     def parse(self, output):
         if output == 'True' or output == 'False':
@@ -252,6 +640,29 @@ class Python(Lang):
             return Float('float(%s)' % output)
         return Undecided(output)
 
+    def kind(self, x): return 'type(%s).__name__' % x
+    def chain(self, terms, ops):
+        return ' '.join(sum(zip(terms, ops), ())) + ' ' + terms[-1]
+
+    # each comparison is made separately in the harness so one that raises
+    # (complex ordering, say) shows up as None rather than sinking the rest
+    def relations(self, x, y): return '__wat_relations(%s, %s)' % (x, y)
+    def ballast(self, n):
+        # half of them freed in a random order, which is what moves python's
+        # allocator about
+        return ("(lambda r, xs: (r.shuffle(xs), globals().setdefault('__wat_ballast', [])"
+                ".extend(xs[:len(xs) // 2]), None)[2])"
+                "(__import__('random').Random(%d), [(slice(i), [i], {}) for i in range(%d)])"
+                % (n, n))
+
+    def parse_relations(self, output):
+        m = re.match(r'^\((.*)\)$', output)
+        if not m:
+            return None
+        vals = [self.parse(v.strip()) for v in m.group(1).split(',')]
+        return dict((op, None if v == 'None' else self.true() == v)
+                        for op, v in zip(self.relation_ops, vals))
+
     def types(self): return [
         Null('None'),
         Type('type'),
@@ -310,12 +721,12 @@ class Python(Lang):
     def zero_div_0(self): return Float('0/0')
 
     def complexs(self): return [
-            Int('0j'),
-            Int('1j'),
-            Int('-1j'),
-            Float('1.0j'),
-            Float('0.0j'),
-            Float('-1.0j'),
+            Complex('0j'),
+            Complex('1j'),
+            Complex('-1j'),
+            Complex('1.0j'),
+            Complex('0.0j'),
+            Complex('-1.0j'),
         ]
 
     def numbers(self):
@@ -377,7 +788,7 @@ class Python(Lang):
             self.funcs() + self.classes() + self.objects() + self.modules()
 
 
-class Javascript(Lang):
+class Javascript(Resident):
     # ref: Standard ECMA-262 ECMAScript Language Specification Edition 5.1 (June 2011)
     # http://www.ecma-international.org/publications/files/ECMA-ST/Ecma-262.pdf
 
@@ -385,25 +796,160 @@ class Javascript(Lang):
 
     name = 'js'
     longname = 'Javascript'
-    version = ''
-    proc = None
-
-    def __init__(self):
-        self.version = 'node.js ' + os.popen('js --version').readline().strip()
-        self.proc = Popen('js', shell=True, stdin=PIPE, stdout=PIPE, close_fds=True)
+    executable = 'js'
+    version_cmd = 'echo node.js `%(exe)s --version`'
+    cmd = ['-e']
+    # expressions are evaluated as the REPL would (braces first tried as an
+    # object literal) and answered with what it would have printed, in
+    # frames rather than scraped from between prompts. a frame of kind
+    # "kernel" holds the arguments for matrix(), which answers with a frame
+    # of codes per row (see operation_matrix); it does without vm's
+    # timeouts, which cost more than the expressions, and leaves a hang to
+    # the deadline on the row. one of kind "bind" holds names and operands
+    # to bind them to (see Lang.bind)
+    driver = r"""
+var fs = require('fs'), vm = require('vm'), util = require('util');
+var input = Buffer.alloc(0);
+function more() {
+    var chunk = Buffer.alloc(65536), n;
+    try {
+        n = fs.readSync(0, chunk, 0, chunk.length, null);
+    } catch (e) {
+        if (e.code === 'EAGAIN') return true;
+        if (e.code === 'EOF') return false;
+        throw e;
+    }
+    input = Buffer.concat([input, chunk.slice(0, n)]);
+    return n > 0;
+}
+function frame(s, kind, type) {
+    fs.writeSync(1, '\x01' + Buffer.byteLength(s) + (kind || type ? ' ' + (kind || '') : '') +
+                    (type ? ' ' + type : '') + '\n' + s);
+}
+// the Types code for a result
+function typeOf(r) {
+    if (r === undefined || r === null) return 6;
+    switch (typeof r) {
+    case 'boolean': return 7;
+    case 'number': return Number.isInteger(r) ? 8 : 9;
+    case 'bigint': return 8;
+    case 'string': return 11;
+    case 'function':
+        // constructors, built in or declared with class
+        return r.prototype && /^class\b|\[native code\]/.test(Function.prototype.toString.call(r))
+            ? 14 : 13;
+    }
+    if (Array.isArray(r) || ArrayBuffer.isView(r)) return 11;
+    if (r instanceof Set || r instanceof Map) return 12;
+    return 15;
+}
+function evaluate(src, options) {
+    if (/^\s*{/.test(src)) {
+        try {
+            return vm.runInThisContext('(' + src + ')', options);
+        } catch (e) {
+            if (!(e instanceof SyntaxError)) throw e;
+        }
+    }
+    return vm.runInThisContext(src, options);
+}
+function compile(params, body) {
+    try {
+        return new Function(params.join(', '), 'return (' + body + ');');
+    } catch (e) {
+        return null;
+    }
+}
+function matrix(operands, names, refs, unary, binary, start, step) {
+    var values = Object.create(null), n = 0, rows = [];
+    unary.forEach(function (op) { rows.push([-1, op]); });
+    operands.forEach(function (x, i) { binary.forEach(function (op) { rows.push([i, op]); }); });
+    // each operator compiled once, and called on the bound operands; cells
+    // with an operand that isn't bound, and x op x, are evaluated as source
+    var ones = {}, twos = {};
+    unary.forEach(function (op) { ones[op] = compile(['b'], op + ' b'); });
+    binary.forEach(function (op) { twos[op] = compile(['a', 'b'], 'a ' + op + ' b'); });
+    var bound = names.map(function (name) { return name in global; });
+    rows.filter(function (row, k) {
+        return k >= start && (k - start) % step === 0;
+    }).forEach(function (row) {
+        var i = row[0], op = row[1], f = i < 0 ? ones[op] : twos[op];
+        var fresh = [], codes = refs.map(function (y, j) {
+            var r;
+            try {
+                if (f && bound[j] && i < 0) r = f(global[names[j]]);
+                else if (f && bound[j] && i !== j && bound[i]) r = f(global[names[i]], global[names[j]]);
+                else r = evaluate(i < 0 ? op + ' ' + y :
+                                  i === j ? operands[i] + ' ' + op + ' ' + operands[j] :
+                                  refs[i] + ' ' + op + ' ' + y);
+            } catch (e) {
+                return 1;
+            }
+            if (r === true) return 3;
+            if (r === false) return 4;
+            var out = util.inspect(r);
+            if (!(out in values)) { values[out] = n++ + 5; fresh.push(out); }
+            return values[out];
+        });
+        frame(JSON.stringify([fresh, codes]));
+    });
+}
+for (;;) {
+    var nl;
+    while ((nl = input.indexOf(10)) < 0)
+        if (!more()) process.exit(0);
+    var header = input.slice(1, nl).toString().split(' '), size = parseInt(header[0], 10);
+    while (input.length < nl + 1 + size)
+        if (!more()) process.exit(0);
+    var code = input.slice(nl + 1, nl + 1 + size).toString();
+    input = input.slice(nl + 1 + size);
+    if (header[1] === 'kernel') {
+        matrix.apply(null, JSON.parse(code));
+        continue;
+    }
+    if (header[1] === 'bind') {
+        var args = JSON.parse(code), bound = [];
+        args[0].forEach(function (name, i) {
+            try {
+                global[name] = evaluate(args[1][i], {timeout: 1000});
+                bound.push(name);
+            } catch (e) {}
+        });
+        frame(JSON.stringify(bound));
+        continue;
+    }
+    var out, kind = '', type = 0;
+    try {
+        var r = evaluate(code, {timeout: 1000});
+        out = util.inspect(r);
+        type = typeOf(r);
+    } catch (e) {
+        kind = e && e.code === 'ERR_SCRIPT_EXECUTION_TIMEOUT' ? 'Timeout' :
+               (e && e.name) || 'Error';
+        out = String(e);
+    }
+    frame(out, kind, type);
+}
+"""
 
-    def run(self, code):
-        print >> self.proc.stdin, code + '\n'
-        output = self.proc.stdout.readline()[2:].strip() # toss "> " prompt prefix
-        return output.strip()
-
-        """
-        with os.popen('timeout 1 js > tmp.js.out', 'w') as p:
-            p.write(code + '\n')
-        with open('tmp.js.out') as out:
-            output = out.readline()[2:].strip() # toss "> " prompt prefix
-        return output.strip()
-        """
+    def spawn(self):
+        Resident.spawn(self)
+        self.bind()
+
+    binds = True
+    def send_bindings(self, names, sources):
+        write_frame(self.proc.stdin, json.dumps([names, sources]), 'bind')
+        self.proc.stdin.flush()
+
+    def kernel(self, operands, names, refs, unary, binary, start=0, step=1):
+        if self.proc.poll() is not None:
+            self.restart()
+        write_frame(self.proc.stdin,
+                    json.dumps([operands, names, refs, unary, binary, start, step]), 'kernel')
+        self.proc.stdin.flush()
+        rows = len(xrange(start, len(unary) + len(operands) * len(binary), step))
+        for row in self.frames(rows, self.timeout * len(operands)):
+            yield json.loads(row)
 
     def parse(self, output):
         if output == 'true' or output == 'false':
@@ -412,6 +958,17 @@ class Javascript(Lang):
             return Float(output)
         return Undecided(output)
 
+    def kind(self, x): return 'Object.prototype.toString.call(%s)' % x
+
+    def relations(self, x, y):
+        return '[%s]' % ', '.join('%s %s %s' % (x, op, y) for op in self.relation_ops)
+    def parse_relations(self, output):
+        m = re.match(r'^\[(.*)\]$', output)
+        if not m:
+            return None
+        vals = [self.parse(v.strip()) for v in m.group(1).split(',')]
+        return dict((op, self.true() == v) for op, v in zip(self.relation_ops, vals))
+
     def types(self): return [
         Null('undefined'),
         Null('null'),
@@ -536,33 +1093,81 @@ import sys
 import itertools
 
 cmds = set()
+# classes rather than instances; each one is started when its turn comes
 langs = [
-    Python(),
-    Javascript(), # nodejs is slow to start, it's not really designed to boot up quickly...
+    Python,
+    Javascript, # nodejs is slow to start, it's not really designed to boot up quickly...
     #Ruby,
     #PHP,
     #Perl, # boring... everthing is a fucking variable and weird behavior is not interesting
 ]
+# every backend there is, by name
+lang_classes = dict((cls.name, cls) for cls in [Python, Javascript, Ruby, PHP, Perl])
+
+instances = {}
+instances_lock = threading.Lock()
+
+def backend(cls, workers=1):
+    # one instance per backend (and number of workers), kept warm for the
+    # next task that wants it rather than started again
+    with instances_lock:
+        if (cls, workers) not in instances:
+            instances[cls, workers] = Workers(cls, workers) if workers > 1 else cls()
+        return instances[cls, workers]
+
+def versions(cls, executables):
+    # a backend class for each of executables, interpreters for cls's
+    # language, named for the version it turns out to be (py-2.7.18,
+    # py-3.12.1) so that each has files of its own while its results are
+    # stored with the rest of the language's (by family and version).
+    # an executable that's the same version as one before it would only
+    # give the same results, so it's left out
+    found, seen = [], {}
+    for exe in executables:
+        version = type(cls)(cls.__name__, (cls,), {'executable': exe})().version
+        if not version:
+            raise Exception('%s: %s has no version' % (cls.name, exe))
+        if version in seen:
+            print '%s: %s is %s, as is %s' % (cls.name, exe, version, seen[version])
+            continue
+        seen[version] = exe
+        found.append(type(cls)(cls.__name__, (cls,), {
+            'executable': exe, 'version': version, 'family': cls.name,
+            'name': '%s-%s' % (cls.name, re.sub(r'[^\w.]+', '-', version))}))
+    return found
+
+def in_shard(k, shard):
+    # whether the kth item of a run belongs to shard (i, n), i from 0: every
+    # nth item, from the ith. the same items always split the same way, so n
+    # runs given i = 0..n-1 cover them exactly once between them, wherever
+    # they run (see merge())
+    return shard is None or k % shard[1] == shard[0]
+
+def count_operations(lang):
+    n = len(lang.operands())
+    return len(lang.unary()) * n + n * len(lang.binary()) * n
 
 def operations(lang):
     # return all possible operations using operators and operands
     return itertools.imap(
-        lambda x: ' '.join([str(y) for y in x]),
+        lambda x: operation(lang, *x),
         itertools.chain(
-            itertools.product(lang.unary(), lang.operands()),
+            itertools.product([''], lang.unary(), lang.operands()),
             itertools.product(
                 lang.operands(),
                 lang.binary(),
                 lang.operands())))
 
-def get_results(lang, code):
-    output = lang.run(code)
+def classify(lang, output):
     if lang.is_err(output):
         output = 'error'
     elif lang.is_nop(output):
         output = ''
     return output
 
+def get_results(lang, code):
+    return classify(lang, lang.run(code))
+
 EmptySet = set()
 BoringResults = set(['', 'error'])
 
@@ -573,7 +1178,294 @@ def is_interesting(results):
 def esc(s):
     return str(s).replace('"', '\\"')
 
-def graphviz(lang, vals, cmps):
+def write_frame(f, s, kind=''):
+    f.write('\x01%d%s\n%s' % (len(s), ' ' + kind if kind else '', s))
+
+class Crash(Exception):
+    pass
+
+class Timeout(Crash):
+    pass
+
+class Output(str):
+    # output the backend has said the type of (as Types), rather than text
+    # we'd have to parse; see Lang.value()
+    def __new__(cls, output, type):
+        self = str.__new__(cls, output)
+        self.type = type
+        return self
+
+class Failure(Output):
+    # output for an error the backend caught and reported itself, rather
+    # than text we had to recognise; kind is the error's class name in the
+    # target language. running out of time is a crash whatever the backend
+    # calls it (python's harness raises WatTimeout)
+    def __new__(cls, output, kind):
+        self = Output.__new__(cls, output,
+            Types.ERR_CRASH if kind == 'Crash' or kind.endswith('Timeout') else
+            Types.ERR_COMPILE if kind == 'SyntaxError' else Types.ERR_RUN)
+        self.kind = kind
+        return self
+
+class Lost(Failure):
+    # what drive() answers for an expression its interpreter never did, by
+    # hanging or dying on it; that could be the machine rather than the
+    # expression, so it isn't stored (see ResultStore.put_many) and is run
+    # again next time
+    pass
+
+class Expr(str):
+    # an expression as it's reported and stored, with operands as their
+    # source text, carrying what is actually sent: the same with operands
+    # by the names they're bound to (see Lang.bind)
+    def __new__(cls, text, wire):
+        self = str.__new__(cls, text)
+        self.wire = wire
+        return self
+
+def wire(code):
+    return getattr(code, 'wire', code)
+
+def plain(x):
+    # a name or number, which needs no parentheses around it
+    return re.match(r'^[\w$.]+$', str(x)) is not None
+
+def enclosed(x):
+    # whether x is already one parenthesized expression: (lambda x:x), but
+    # not (function(){})(), nor () or (1, 2), which after a function are its
+    # arguments. parentheses in string literals don't count
+    x = re.sub(r'"(\\.|[^"\\])*"|\'(\\.|[^\'\\])*\'', '""', str(x))
+    depth = 0
+    for i, c in enumerate(x):
+        depth += {'(': 1, ')': -1}.get(c, 0)
+        if depth == 0:
+            return i == len(x) - 1 and i > 1
+        if depth == 1 and c == ',':
+            return False
+    return False
+
+def source(x):
+    # an operand as written into an expression: in parentheses unless it's a
+    # plain name or number, so the text means what the expression with x
+    # bound does (-1 ** 2 is -(1 ** 2), the bound -1 squared is 1)
+    x = str(x)
+    return x if plain(x) or enclosed(x) else '(%s)' % x
+
+def reference(lang, x):
+    # what an expression calls x by: its bound name, or its source(). the
+    # name is in parentheses wherever the source is, so the two parse alike
+    # (len ("") is a call, len _w1 a syntax error)
+    ref = lang.ref(x)
+    if ref == str(x):
+        return source(x)
+    return ref if plain(x) else '(%s)' % ref
+
+def bound(lang, build, *operands):
+    # build(*operands) as an Expr, its text from each operand's source(). an
+    # operand that appears more than once is spelled out each time, so that
+    # each is still an object of its own: xrange(0) > xrange(0) compares two
+    # xranges, not one with itself
+    sources = [str(x) for x in operands]
+    names = [source(x) if sources.count(x) > 1 else reference(lang, x) for x in sources]
+    return Expr(build(*[source(x) for x in sources]), build(*names))
+
+def operation(lang, x, op, y):
+    # x op y as an Expr, or op y where x is ''
+    if x == '':
+        return bound(lang, lambda y: '%s %s' % (op, y), y)
+    return bound(lang, lambda x, y: '%s %s %s' % (x, op, y), x, y)
+
+class Channel:
+    # the reading end of a backend's pipe. a frame is
+    #   "\x01<length>[ <error kind>[ <Types code>]]\n<output>"
+    # and anything else the child prints (warnings, prompts and the like)
+    # before a header is skipped. reads never block, so one select() can
+    # wait on any number of channels (see drive()); frames are taken from
+    # what has been read as they complete
+    def __init__(self, f):
+        self.fd = f.fileno()
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, fcntl.fcntl(self.fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.buf = ''
+        self.eof = False
+
+    def fileno(self):
+        return self.fd
+
+    def fill(self):
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except OSError, e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+        if not data:
+            self.eof = True
+        self.buf += data
+
+    def frame(self):
+        # the next whole frame, or None
+        i = self.buf.find('\x01')
+        if i < 0:
+            self.buf = ''
+            return None
+        nl = self.buf.find('\n', i)
+        if nl < 0:
+            self.buf = self.buf[i:]
+            return None
+        size, kind, type = (self.buf[i + 1:nl].split(' ', 2) + ['', ''])[:3]
+        end = nl + 1 + int(size)
+        if len(self.buf) < end:
+            self.buf = self.buf[i:]
+            return None
+        output = self.buf[nl + 1:end]
+        self.buf = self.buf[end:]
+        if kind:
+            return Failure(output, kind)
+        if int(type or 0):
+            return Output(output, int(type))
+        return output
+
+    def wait(self, deadline):
+        # block for the next frame until the deadline
+        while True:
+            output = self.frame()
+            if output is not None:
+                return output
+            self.poll(deadline)
+
+    def skip(self, marker, deadline):
+        # everything up to and including marker
+        while marker not in self.buf:
+            self.poll(deadline)
+        self.buf = self.buf[self.buf.index(marker) + len(marker):]
+
+    def poll(self, deadline):
+        if self.eof:
+            raise Crash('backend exited')
+        left = deadline - time.time()
+        if left <= 0:
+            raise Timeout('backend timed out')
+        if select.select([self], [], [], left)[0]:
+            self.fill()
+
+def drive(langs, codes):
+    # the event loop: codes are evaluated by the interpreters of langs
+    # (instances of one backend), each sent batch_size of them at a time and
+    # another batch as soon as it has answered, and all of them waited on
+    # together with select(). an expression gets lang.timeout seconds from
+    # the answer before it; one that takes longer, or takes its interpreter
+    # down with it, is answered with a Failure, and the interpreter is
+    # restarted and sent the rest of its batch. outputs come back in order.
+    # each expression's time, from the answer before it (or the batch going
+    # out) to its own, goes to stats; frames read together share one arrival
+    outputs = [None] * len(codes)
+    size = langs[0].batch_size
+    todo = range(0, len(codes), size)[::-1]
+    busy = {} # lang -> [next output, end of batch, deadline, last answer]
+    def send(lang, i, end):
+        if lang.proc.poll() is not None:
+            lang.restart()
+        lang.send(codes[i:end])
+        now = time.time()
+        busy[lang] = [i, end, now + lang.timeout, now]
+    def next_batch(lang):
+        busy.pop(lang, None)
+        if todo:
+            i = todo.pop()
+            send(lang, i, min(i + size, len(codes)))
+    def fail(lang, output):
+        i, end, _, last = busy[lang]
+        outputs[i] = output
+        stats.latency(lang.name, [time.time() - last])
+        lang.restart()
+        if i + 1 < end:
+            send(lang, i + 1, end)
+        else:
+            next_batch(lang)
+    for lang in langs:
+        next_batch(lang)
+    while busy:
+        wait = min(b[2] for b in busy.values()) - time.time()
+        ready = select.select([lang.channel for lang in busy], [], [], max(wait, 0))[0]
+        for channel in ready:
+            channel.fill()
+        now = time.time()
+        for lang in busy.keys():
+            b = busy[lang]
+            took = []
+            while b[0] < b[1]:
+                output = lang.channel.frame()
+                if output is None:
+                    break
+                # typed output is exactly what the backend said
+                outputs[b[0]] = lang.unbind(output if isinstance(output, Output) else output.strip())
+                b[0] += 1
+                b[2] = now + lang.timeout
+                took.append(now - b[3])
+                b[3] = now
+            if took:
+                stats.latency(lang.name, took)
+            if b[0] == b[1]:
+                next_batch(lang)
+            elif lang.channel.eof:
+                fail(lang, Lost('Crash', 'Crash'))
+            elif time.time() > b[2]:
+                fail(lang, Lost('timed out', 'Timeout'))
+    return outputs
+
+def reduce_edges(G):
+    # remove redundant edges: if x reaches y some other way we don't need a
+    # direct x -> y; favor more, "shorter" paths that outline the total
+    # ordinality over "long" paths that clutter our graph. edges are taken in
+    # G.edges() order and each goes if x still reaches y without it, so the
+    # transitive closure is unchanged.
+    # strongly connected components are condensed into a DAG, what each
+    # component reaches is worked out once as a bitset (children before
+    # parents), and edges from component c to d all go if d is reachable
+    # through another of c's successors; otherwise only the last of them is
+    # needed. inside a component, paths never leave it, so its edges are
+    # checked against its own subgraph
+    sccs = list(nx.strongly_connected_components(G))
+    comp = {}
+    for i, scc in enumerate(sccs):
+        for x in scc:
+            comp[x] = i
+    C = nx.DiGraph()
+    C.add_nodes_from(xrange(len(sccs)))
+    C.add_edges_from((comp[x], comp[y]) for x, y in G.edges() if comp[x] != comp[y])
+    reach = {}
+    for c in reversed(list(nx.topological_sort(C))):
+        bits = 0
+        for d in C.successors(c):
+            bits |= (1 << d) | reach[d]
+        reach[c] = bits
+    redundant = set()
+    for c in C.nodes():
+        via = 0
+        for d in C.successors(c):
+            via |= reach[d]
+        redundant.update((c, d) for d in C.successors(c) if via >> d & 1)
+    last = {}
+    for x, y in G.edges():
+        if comp[x] != comp[y]:
+            last[comp[x], comp[y]] = (x, y)
+    inside = dict((i, G.subgraph(scc).copy()) for i, scc in enumerate(sccs) if len(scc) > 1)
+    remove = []
+    for x, y in G.edges():
+        c, d = comp[x], comp[y]
+        if c != d:
+            if (c, d) in redundant or last[c, d] != (x, y):
+                remove.append((x, y))
+        elif c in inside:
+            S = inside[c]
+            S.remove_edge(x, y)
+            if x == y or nx.has_path(S, x, y):
+                remove.append((x, y))
+            else:
+                S.add_edge(x, y)
+    G.remove_edges_from(remove)
+
+def graphviz(lang, vals, cmps, render=True, classes=(), clusters=True, flaky=(), collapse=False):
 
     G = nx.DiGraph()
 
@@ -596,27 +1488,40 @@ def graphviz(lang, vals, cmps):
     #nodes_in_cycles = set(sum(nx.simple_cycles(G), []))
     #print 'nodes_in_cycles:', nodes_in_cycles
 
-    # remove redundant edges
-    # TODO: ultimately, it would be faster to NOT run redundant tests
-    for x, y in G.edges():
-        # if any of x's successors has a path to y then I don't need a direct path
-        # favor more, "shorter" paths that outline the total ordinality than
-        # "long" paths that clutter our graph
-        existing = [
-            s for s in G.successors(x)
-                if s != x and s != y and nx.has_path(G, s, y) ]
-        if existing:
-            print 'remove_edge(%s, %s) because of %s' % (x, y, existing)
-            G.remove_edge(x, y)
-            if not nx.has_path(G, x, y):
-                # we thought we could remove an edge and still have a path x->y,
-                # but that was an illusion due to a cycle in our directional
-                # graph; put the edge back in to preserve the path
-                G.add_edge(x, y)
-
-    print key.items()
-
-    with open(lang.name + ".ord.dot", "w") as dot:
+    with stats.phase('reduction'):
+        reduce_edges(G)
+
+    members = dict((str(c[0]), [str(x) for x in c]) for c in classes)
+    if collapse:
+        # the condensation: each cycle becomes one node, named for its first
+        # operand and listing everything in it, with only the edges between
+        # such nodes left
+        order = dict((str(x), i) for i, x in enumerate(vals))
+        rep = {}
+        for scc in nx.strongly_connected_components(G):
+            scc = sorted(scc, key=order.get)
+            for x in scc:
+                rep[x] = scc[0]
+            if len(scc) > 1:
+                members[scc[0]] = sum([members.get(x, [x]) for x in scc], [])
+        C = nx.DiGraph()
+        C.add_nodes_from(set(rep.values()))
+        collapsed = {}
+        for x, y in G.edges():
+            if rep[x] != rep[y]:
+                C.add_edge(rep[x], rep[y])
+                collapsed.setdefault(rep[x], {})[rep[y]] = link[x][y]
+        flaky = set(frozenset(rep.get(x, x) for x in f) for f in flaky
+                        if len(f) == 1 or len(set(rep.get(x, x) for x in f)) > 1)
+        vals = [x for x in vals if rep.get(str(x), str(x)) == str(x)]
+        G, link = C, collapsed
+    label = dict((x, '\\n'.join(esc(m) for m in c)) for x, c in members.items() if len(c) > 1)
+    sccs = []
+    if clusters:
+        sccs = [scc for scc in nx.strongly_connected_components(G) if len(scc) > 1]
+    cycle = dict((x, i) for i, scc in enumerate(sccs) for x in scc)
+
+    with stats.phase('dot writing'), open(lang.name + ".ord.dot", "w") as dot:
         dot.write('digraph {\n')
         dot.write('label="%s (%s)\\n%s\\n"\n' % (
             lang.longname, lang.version, 'Built-in Ordinality'))
@@ -626,47 +1531,1437 @@ def graphviz(lang, vals, cmps):
         dot.write('edge [fontsize=18, penwidth=0.5, color="#999999"]\n')
         dot.write('node [fontsize=12, shape=box, penwidth=0.5, style="filled", fillcolor="#ffffcc", color="#ff9900"]\n')
 
-        # ensure that anything that isn't connected still gets a visual node
+        # ensure that anything that isn't connected still gets a visual node;
+        # a class of equivalent operands is drawn as one, listing them all,
+        # and each cycle is boxed in a cluster of its own
+        def node(x):
+            attrs = []
+            if str(x) in label:
+                attrs.append('label="%s", peripheries=2' % label[str(x)])
+            if frozenset([str(x)]) in flaky:
+                # isn't even consistent with itself
+                attrs.append('style="filled,dashed"')
+            dot.write("%s%s\n" % (key[str(x)], ' [%s]' % ', '.join(attrs) if attrs else ''))
         for x in vals:
-            dot.write("%s\n" % key[x])
+            if str(x) not in cycle:
+                node(x)
+        for i, scc in enumerate(sccs):
+            dot.write('subgraph cluster_%d {\n' % i)
+            dot.write('label="cycle"; style="dashed"; color="#cc0000"; fontsize=14\n')
+            for x in vals:
+                if str(x) in scc:
+                    node(x)
+            dot.write('}\n')
         for x, y in G.edges():
             if link[x].has_key(y):
                 op = link[x][y]
             else:
                 op = link[y][x]
                 x,y = y,x
-            dot.write('%s -> %s [label="%s"]\n' % (key[str(x)], key[str(y)], esc(op)))
+            # edges that don't always hold are dashed
+            style = ', style="dashed", color="#cc0000"' if frozenset([x, y]) in flaky else ''
+            dot.write('%s -> %s [label="%s"%s]\n' % (key[str(x)], key[str(y)], esc(op), style))
         dot.write('}\n')
+
+    # the same graph for other tools: JSON, and GraphML via networkx
+    nodes = [{'id': str(x), 'members': members.get(str(x), [str(x)]),
+              'cycle': cycle.get(str(x))} for x in vals]
+    edges = [{'source': x, 'target': y, 'op': link[x][y], 'flaky': frozenset([x, y]) in flaky}
+                for x, y in G.edges()]
+    with stats.phase('export'):
+        with open(lang.name + '.ord.json', 'w') as f:
+            json.dump({'lang': lang.name, 'version': lang.version,
+                       'nodes': nodes, 'edges': edges}, f, indent=1)
+        H = nx.DiGraph()
+        for n in nodes:
+            H.add_node(n['id'], members='\n'.join(n['members']),
+                       cycle=-1 if n['cycle'] is None else n['cycle'])
+        for e in edges:
+            H.add_edge(e['source'], e['target'], op=e['op'], flaky=e['flaky'])
+        nx.write_graphml(H, lang.name + '.ord.graphml')
+
+    if not render:
+        return
     gen_graph_cmd = ['dot','-Tpng','-o','%s.ord.png'%lang.name,'%s.ord.dot'%lang.name]
     print gen_graph_cmd
-    subprocess.call(gen_graph_cmd)
+    render_later(gen_graph_cmd)
+
+renders = []
+
+def render_later(cmd):
+    # layout can take longer than the evaluation did, so it runs in the
+    # background while the next language gets on; see finish_renders()
+    def run():
+        with stats.phase('rendering'):
+            try:
+                subprocess.call(cmd)
+            except OSError, e:
+                print '%s: %s' % (cmd[0], e)
+    t = threading.Thread(target=run)
+    t.start()
+    renders.append(t)
+
+def finish_renders():
+    while renders:
+        renders.pop().join()
+
+class ResultMatrix:
+    # results for every (x, op, y) over a list of operands and operators, as
+    # a dense array of small integer codes indexed [x][op][y] with operands
+    # and operators interned to their positions. codes below FIRST_VALUE say
+    # what kind of result it was; anything else is an output string, interned
+    # in self.values. codes start out as unsigned shorts and widen to 'I'
+    # should there be more values than that holds. saved as
+    #   "WATM1\n", header length (uint32), JSON header, codes
+    # and load() maps the codes straight out of the file rather than reading
+    # them in
+    UNKNOWN, ERROR, NOP, TRUE, FALSE = range(5)
+    FIRST_VALUE = 5
+    magic = 'WATM1\n'
+
+    def __init__(self, operands, ops, lang=None, version=None, values=()):
+        self.lang = lang
+        self.version = version
+        self.operands = [str(x) for x in operands]
+        self.ops = [str(op) for op in ops]
+        self.ids = dict((x, i) for i, x in enumerate(self.operands))
+        self.op_ids = dict((op, i) for i, op in enumerate(self.ops))
+        self.values = list(values)
+        self.value_ids = dict((v, i + self.FIRST_VALUE) for i, v in enumerate(self.values))
+        self.codes = array.array('H', [self.UNKNOWN]) * (len(self.operands) ** 2 * len(self.ops))
+        self.mm = None
+
+    def index(self, x, op, y):
+        return (self.ids[str(x)] * len(self.ops) + self.op_ids[op]) * len(self.operands) + self.ids[str(y)]
+
+    def get(self, x, op, y):
+        return self.at(self.index(x, op, y))
+
+    def at(self, i):
+        if self.mm is None:
+            return self.codes[i]
+        return struct.unpack_from(self.fmt, self.mm, self.offset + i * self.size)[0]
+
+    def set(self, x, op, y, code):
+        self.codes[self.index(x, op, y)] = code
+
+    def code(self, lang, output):
+        # what to store for an output from lang
+        if lang.is_err(output):
+            return self.ERROR
+        if lang.is_nop(output):
+            return self.NOP
+        if lang.true() == output:
+            return self.TRUE
+        if lang.false() == output:
+            return self.FALSE
+        return self.intern(output)
+
+    def intern(self, output):
+        if output not in self.value_ids:
+            code = len(self.values) + self.FIRST_VALUE
+            if self.codes is not None and code >> (8 * self.codes.itemsize):
+                self.codes = array.array('I', self.codes)
+            self.value_ids[output] = code
+            self.values.append(output)
+        return self.value_ids[output]
+
+    def output(self, code):
+        return self.values[code - self.FIRST_VALUE] if code >= self.FIRST_VALUE else None
+
+    def merge(self, other):
+        # fill in whatever other has that this doesn't, for the same lang,
+        # version, operands and operators. returns how many cells both had
+        # with the same result, and the indexes of those they disagree on
+        # (this one's are kept)
+        for attr in ['lang', 'version', 'operands', 'ops']:
+            if getattr(self, attr) != getattr(other, attr):
+                raise Exception('merge: %s differs (%r, %r)' % (
+                    attr, getattr(self, attr), getattr(other, attr)))
+        same, conflicts = 0, []
+        for i in xrange(len(self.codes)):
+            code = other.at(i)
+            if code == self.UNKNOWN:
+                continue
+            if code >= self.FIRST_VALUE:
+                code = self.intern(other.output(code))
+            if self.codes[i] == self.UNKNOWN:
+                self.codes[i] = code
+            elif self.codes[i] == code:
+                same += 1
+            else:
+                conflicts.append(i)
+        return same, conflicts
+
+    def gaps(self):
+        # how many cells other than x ? x nothing has filled in
+        n, ops = len(self.operands), len(self.ops)
+        return sum(1 for i in xrange(n * n * ops)
+                       if i // (n * ops) != i % n and self.at(i) == self.UNKNOWN)
+
+    def set_relations(self, x, y, profile):
+        # a relation profile from comparisons(), and its flip for y ? x
+        for p, a, b in [(profile, x, y), (flip(profile), y, x)]:
+            for op in self.ops:
+                if op in p:
+                    self.set(a, op, b, self.ERROR if p[op] is None else
+                                       self.TRUE if p[op] else self.FALSE)
+                elif not profile:
+                    self.set(a, op, b, self.ERROR)
+
+    def relations(self, x, y):
+        codes = dict((op, self.get(x, op, y)) for op in self.ops)
+        return dict((op, None if code == self.ERROR else code == self.TRUE)
+                        for op, code in codes.items() if code != self.UNKNOWN)
+
+    def save(self, path):
+        codes = len(self.values) + self.FIRST_VALUE
+        typecode = 'B' if codes <= 2 ** 8 else 'H' if codes <= 2 ** 16 else 'I'
+        codes = array.array(typecode, self.codes)
+        if sys.byteorder == 'big':
+            codes.byteswap()
+        header = json.dumps({
+            'lang': self.lang, 'version': self.version, 'typecode': typecode,
+            'operands': self.operands, 'ops': self.ops,
+            'values': [v.decode('latin-1') for v in self.values]})
+        with open(path, 'wb') as f:
+            f.write(self.magic)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(codes.tostring())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(cls.magic)] != cls.magic:
+            raise Exception('%s is not a result matrix' % path)
+        size, = struct.unpack_from('<I', mm, len(cls.magic))
+        start = len(cls.magic) + 4
+        header = json.loads(mm[start:start + size])
+        self = cls([], [], header['lang'], header['version'],
+                   [v.encode('latin-1') for v in header['values']])
+        self.operands = [str(x) for x in header['operands']]
+        self.ops = [str(op) for op in header['ops']]
+        self.ids = dict((x, i) for i, x in enumerate(self.operands))
+        self.op_ids = dict((op, i) for i, op in enumerate(self.ops))
+        self.codes = None
+        self.mm = mm
+        self.fmt = '<' + str(header['typecode'])
+        self.size = struct.calcsize(self.fmt)
+        self.offset = start + size
+        return self
+
+class Stats:
+    # where a run's time goes, to tune worker counts and batch sizes by:
+    # per backend, a histogram of time per expression (log2 buckets of
+    # microseconds, as drive() sees each answer arrive), counters, and
+    # expressions done per `interval` seconds;
+    # plus time spent in each phase. shared by every thread, hence the lock
+    def __init__(self, interval=10):
+        self.lock = threading.Lock()
+        self.began = time.time()
+        self.interval = interval
+        self.backends = {}
+        self.phases = {}
+
+    def backend(self, name):
+        return self.backends.setdefault(name, {
+            'latency': {}, 'throughput': {}, 'exprs': 0, 'errors': 0,
+            'timeouts': 0, 'restarts': 0, 'hits': 0, 'misses': 0})
+
+    def count(self, name, counter, n=1):
+        with self.lock:
+            self.backend(name)[counter] += n
+
+    def run(self, lang, codes):
+        start = time.time()
+        outputs = lang.run_many(codes)
+        elapsed = time.time() - start
+        if not outputs:
+            return outputs
+        errors = [output for output in outputs if lang.is_err(output)]
+        timeouts = [e for e in errors if 'timeout' in getattr(e, 'kind', e).lower()]
+        self.record(lang.name, len(outputs), elapsed, len(errors), len(timeouts))
+        return outputs
+
+    def record(self, name, n, elapsed, errors=0, timeouts=0):
+        # n expressions that took elapsed seconds between them
+        slot = int((time.time() - self.began) / self.interval)
+        with self.lock:
+            b = self.backend(name)
+            b['throughput'][slot] = b['throughput'].get(slot, 0) + n
+            b['exprs'] += n
+            b['errors'] += errors
+            b['timeouts'] += timeouts
+
+    def latency(self, name, seconds):
+        # the time each of a few expressions took
+        with self.lock:
+            latency = self.backend(name)['latency']
+            for s in seconds:
+                bucket = int(math.log(max(s * 1e6, 1), 2))
+                latency[bucket] = latency.get(bucket, 0) + 1
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + time.time() - start
+
+    @staticmethod
+    def percentile(latency, p):
+        # upper bound of the bucket the p'th percentile falls in, in us
+        total = sum(latency.values())
+        seen = 0
+        for bucket in sorted(latency):
+            seen += latency[bucket]
+            if seen >= total * p:
+                return 2 ** (bucket + 1)
+        return 0
+
+    def line(self):
+        with self.lock:
+            parts = []
+            elapsed = max(time.time() - self.began, 1e-6)
+            for name, b in sorted(self.backends.items()):
+                looked = b['hits'] + b['misses']
+                parts.append('%s %d exprs %.0f/s p50 %dus p99 %dus err %d timeout %d restart %d cache %.0f%%' % (
+                    name, b['exprs'], b['exprs'] / elapsed,
+                    self.percentile(b['latency'], 0.5), self.percentile(b['latency'], 0.99),
+                    b['errors'], b['timeouts'], b['restarts'],
+                    100.0 * b['hits'] / looked if looked else 0))
+            return ' | '.join(parts)
+
+    def dump(self, path='wat.stats.json'):
+        with self.lock:
+            out = {'elapsed': time.time() - self.began, 'phases': self.phases, 'backends': {}}
+            for name, b in self.backends.items():
+                out['backends'][name] = dict(b,
+                    latency=dict(('<%dus' % 2 ** (k + 1), v) for k, v in sorted(b['latency'].items())),
+                    throughput=[b['throughput'].get(slot, 0) / float(self.interval)
+                                    for slot in xrange(max(b['throughput'] or [-1]) + 1)],
+                    p50_us=self.percentile(b['latency'], 0.5),
+                    p99_us=self.percentile(b['latency'], 0.99))
+        with open(path, 'w') as f:
+            json.dump(out, f, indent=1, sort_keys=True)
+
+stats = Stats()
+
+class ResultStore:
+    # every result we've had back, keyed by (lang, version, expr) and saved
+    # as soon as it arrives, so an interrupted run picks up where it stopped
+    # and a changed operand list only costs the new expressions. lookups go
+    # through the primary key, so a big store is no slower to start from
+    def __init__(self, path='wat.db'):
+        self.path = path
+        self.local = threading.local() # sqlite connections stay in their thread
+        with self.db() as db:
+            db.execute('''create table if not exists results (
+                lang text, version text, expr text, output text, kind text,
+                flaky integer not null default 0, type integer not null default 0,
+                primary key (lang, version, expr))''')
+            # stores from before expressions could be flaky, or had types
+            for column in ['flaky', 'type']:
+                try:
+                    db.execute('alter table results add column %s integer not null default 0'
+                               % column)
+                except sqlite3.OperationalError:
+                    pass
+            # which shard of which run this store holds (see merge())
+            db.execute('''create table if not exists shards (
+                lang text, version text, mode text, shard integer, shards integer,
+                done integer not null default 0,
+                primary key (lang, version, mode))''')
+
+    def db(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=60)
+            conn.text_factory = str
+        return conn
+
+    def get_many(self, lang, codes):
+        found = {}
+        for i in xrange(0, len(codes), 500):
+            chunk = list(codes[i:i + 500])
+            rows = self.db().execute(
+                'select expr, output, kind, type from results '
+                'where lang = ? and version = ? and expr in (%s)' % ','.join('?' * len(chunk)),
+                [lang.family, lang.version] + chunk)
+            for expr, output, kind, type in rows:
+                found[expr] = Failure(output, kind) if kind else \
+                              Output(output, type) if type else output
+        return found
+
+    def put_many(self, lang, codes, outputs):
+        with self.db() as db:
+            db.executemany('insert or replace into results '
+                           '(lang, version, expr, output, kind, type) values (?, ?, ?, ?, ?, ?)', [
+                (lang.family, lang.version, code, str(output), getattr(output, 'kind', ''),
+                 getattr(output, 'type', Types.UNKNOWN))
+                    for code, output in zip(codes, outputs) if not isinstance(output, Lost)])
+
+    # expressions that have been seen to give different outputs on
+    # different runs (see resample()); their output here is just one of them
+    def set_flaky(self, lang, codes):
+        with self.db() as db:
+            db.executemany('update results set flaky = 1 '
+                           'where lang = ? and version = ? and expr = ?',
+                           [(lang.family, lang.version, code) for code in codes])
+
+    def flaky(self, lang, codes):
+        found = set()
+        for i in xrange(0, len(codes), 500):
+            chunk = list(codes[i:i + 500])
+            found.update(expr for expr, in self.db().execute(
+                'select expr from results where flaky and lang = ? and version = ? '
+                'and expr in (%s)' % ','.join('?' * len(chunk)),
+                [lang.family, lang.version] + chunk))
+        return found
+
+    def set_shard(self, lang, mode, shard, done):
+        with self.db() as db:
+            db.execute('insert or replace into shards values (?, ?, ?, ?, ?, ?)',
+                       (lang.name, lang.version, mode, shard[0], shard[1], int(done)))
+
+    def shards(self):
+        # [(lang, version, mode, shard, shards, done)]
+        return self.db().execute('select * from shards').fetchall()
+
+    def merge(self, path):
+        # copy in every result from the store at path. returns how many were
+        # here already with the same output, and those that weren't (expr,
+        # ours, theirs); ours are kept. flaky in either is flaky
+        db = self.db()
+        db.execute('attach database ? as other', (path,))
+        try:
+            with db:
+                same, = db.execute('''select count(*) from results r join other.results o
+                    using (lang, version, expr) where r.output = o.output and r.kind = o.kind
+                    ''').fetchone()
+                conflicts = db.execute('''select r.expr, r.output, o.output from results r
+                    join other.results o using (lang, version, expr)
+                    where r.output != o.output or r.kind != o.kind''').fetchall()
+                db.execute('''update results set flaky = 1 where exists (select 1 from
+                    other.results o where o.flaky and o.lang = results.lang and
+                    o.version = results.version and o.expr = results.expr)''')
+                db.execute('''insert or ignore into results
+                    (lang, version, expr, output, kind, flaky, type)
+                    select lang, version, expr, output, kind, flaky, type from other.results''')
+        finally:
+            db.execute('detach database other')
+        return same, conflicts
+
+def run_all(lang, codes, progress=None, store=None):
+    # run_many() in steps of a few batches so there is something to report,
+    # saving each step as it comes back; whatever the store already has is
+    # not run again
+    known = store.get_many(lang, codes) if store else {}
+    missing = [code for code in codes if code not in known]
+    if store:
+        stats.count(lang.name, 'hits', len(codes) - len(missing))
+        stats.count(lang.name, 'misses', len(missing))
+    step = lang.batch_size * 10
+    if progress:
+        progress.start(lang.name, len(missing))
+    for i in xrange(0, len(missing), step):
+        chunk = missing[i:i + step]
+        outputs = stats.run(lang, chunk)
+        if store:
+            store.put_many(lang, chunk, outputs)
+        known.update(zip(chunk, outputs))
+        if progress:
+            progress.advance(lang.name, len(chunk))
+    return [known[code] for code in codes]
+
+class Progress:
+    # shared by every language in a run; guarded by a lock since each
+    # language reports from its own thread
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = {}
+    def start(self, name, total):
+        with self.lock:
+            task = self.tasks.setdefault(name, {
+                'done': 0, 'total': 0, 'began': time.time(), 'ended': None, 'error': None})
+            task['total'] += total
+    def advance(self, name, n):
+        with self.lock:
+            self.tasks[name]['done'] += n
+    def finish(self, name, error=None):
+        self.start(name, 0)
+        with self.lock:
+            self.tasks[name]['ended'] = time.time()
+            self.tasks[name]['error'] = error
+    def line(self):
+        with self.lock:
+            parts = []
+            for name, t in sorted(self.tasks.items()):
+                if t['error']:
+                    state = 'failed'
+                elif t['ended']:
+                    state = 'done'
+                else:
+                    state = '%d/%d' % (t['done'], t['total'])
+                parts.append('%s %s' % (name, state))
+            return ' | '.join(parts)
+    def report(self):
+        with self.lock:
+            for name, t in sorted(self.tasks.items()):
+                print '%-4s %-6s %6d exprs %8.1fs' % (
+                    name, 'FAILED' if t['error'] else 'ok', t['done'],
+                    (t['ended'] or time.time()) - t['began'])
+                if t['error']:
+                    print t['error'].rstrip()
+    def failed(self):
+        with self.lock:
+            return sorted(name for name, t in self.tasks.items() if t['error'])
+
+def orchestrate(langs, tasks=None, jobs=None, interval=10, workers=1):
+    # run each language's tasks in a thread of its own, at most `jobs` at a
+    # time; languages share nothing, so all the waiting on interpreters
+    # overlaps. tasks are called as task(lang, progress), lang being the
+    # backend() for the class with `workers` interpreters
+    tasks = tasks or [ordinality]
+    progress = Progress()
+    slots = threading.Semaphore(jobs or len(langs))
+    def job(cls):
+        with slots:
+            try:
+                progress.start(cls.name, 0)
+                lang = backend(cls, workers)
+                for task in tasks:
+                    task(lang, progress)
+                progress.finish(cls.name)
+            except Exception:
+                progress.finish(cls.name, traceback.format_exc())
+    threads = [threading.Thread(target=job, args=(cls,)) for cls in langs]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    alive = threads
+    while alive:
+        alive[0].join(interval)
+        print progress.line()
+        print stats.line()
+        alive = [t for t in threads if t.is_alive()]
+    finish_renders()
+    progress.report()
+    return progress
 
 # calculate total language built-in ordinality
 # python is weird
-def ordinality(lang):
-    def do_run_op(x, op, y):
-        code = '%s %s %s' % (x, op, y)
-        result = lang.run(code)
-        return result
+def relation_wats(profile):
+    # relation profiles that no total order could produce, e.g. javascript's
+    # null >= 0 while neither null > 0 nor null == 0
+    p = profile
+    wats = []
+    def known(*ops):
+        return None not in [p.get(op) for op in ops]
+    if known('>=', '>', '==') and p['>='] and not (p['>'] or p['==']):
+        wats.append('>= without > or ==')
+    if known('<=', '<', '==') and p['<='] and not (p['<'] or p['==']):
+        wats.append('<= without < or ==')
+    if known('>=', '>', '==') and not p['>='] and (p['>'] or p['==']):
+        wats.append('> or == without >=')
+    if known('<=', '<', '==') and not p['<='] and (p['<'] or p['==']):
+        wats.append('< or == without <=')
+    if known('==', '!=') and p['=='] == p['!=']:
+        wats.append('== and != agree')
+    if known('>', '<') and p['>'] and p['<']:
+        wats.append('both > and <')
+    return wats
+
+def comparison_exprs(lang, x, y):
+    # what comparisons() runs for the pair
+    if lang.relations(x, y) is not None:
+        return [bound(lang, lang.relations, x, y)]
+    return [bound(lang, lambda x, y: '%s %s %s' % (x, op, y), x, y) for op in lang.relation_ops]
+
+def resample(lang, codes, store=None, workers=4, confirm=2, most=8):
+    # which of codes give different outputs on different runs (python 2's
+    # xrange(0) > xrange(0) goes by memory address). every round runs the
+    # codes still in question again on `workers` fresh interpreters at once,
+    # in a different (seeded) order each time, since an interpreter fed the
+    # same expressions in the same order lays memory out the same way; a
+    # code that has given the same output confirm more times than the
+    # first stops there, and only those that have given more than one go
+    # on, up to `most` runs, to see what else they give. so a stable table
+    # costs confirm extra runs rather than most. flaky codes are flagged in
+    # the store, and returned with every output seen.
+    # every run, the first on lang itself included, sends the codes as
+    # written rather than with bound operands (see Lang.bind): what the
+    # expressions allocate along the way is what moves things about from one
+    # order to the next, and a binding-dependent output isn't a flaky one
+    cls = getattr(lang, 'workers', [lang])[0].__class__
+    seen = dict((code, [output]) for code, output in
+                    zip(codes, stats.run(lang, [str(code) for code in codes])))
+    todo = list(seen)
+    rand = random.Random(0)
+    while todo:
+        rand.shuffle(todo)
+        fresh = Workers(cls, workers)
+        try:
+            # expressions that make and free only their own objects mostly
+            # leave the heap as they found it, so each interpreter's is
+            # stirred up differently first
+            for w in fresh.workers:
+                if w.ballast(0) is not None:
+                    w.run(w.ballast(rand.randint(0, 10000)))
+            for code, output in zip(todo, stats.run(fresh, [str(code) for code in todo])):
+                seen[code].append(output)
+        finally:
+            fresh.close()
+        todo = [code for code in todo
+                    if len(seen[code]) < (most if len(set(seen[code])) > 1 else confirm + 1)]
+    flaky = dict((code, outputs) for code, outputs in seen.items() if len(set(outputs)) > 1)
+    if store:
+        # flags go on results the store has; x ? x is only run here, and
+        # written the same either way (see bound())
+        known = store.get_many(lang, codes)
+        missing = [code for code in codes if code not in known]
+        store.put_many(lang, missing, [seen[code][0] for code in missing])
+        store.set_flaky(lang, list(flaky))
+    print '%s: %d of %d expressions flaky' % (lang.name, len(flaky), len(codes))
+    return flaky
+
+def comparisons(lang, pairs, progress=None, store=None):
+    # the relation profile ({op: True/False/None}) of each pair, in order;
+    # one expression per pair where the backend can manage it, otherwise one
+    # per relation
+    if pairs and lang.relations(*pairs[0]) is not None:
+        results = run_all(lang, [bound(lang, lang.relations, x, y) for x, y in pairs],
+                          progress, store)
+        return [lang.parse_relations(output) or {} for output in results]
+    results = iter(run_all(lang, [code for x, y in pairs
+                                       for code in comparison_exprs(lang, x, y)], progress, store))
+    ops = lang.relation_ops
+    def relation(output):
+        # errors are None, as parse_relations has them
+        return None if lang.is_err(output) else lang.true() == output
+    return [dict((op, relation(next(results))) for op in ops) for _ in pairs]
+
+def flip(profile):
+    # the profile of y ? x given that of x ? y
+    swap = {'>': '<', '<': '>', '>=': '<=', '<=': '>='}
+    return dict((swap.get(op, op), v) for op, v in profile.items())
+
+def scheduled_comparisons(lang, vals, progress=None, store=None):
+    # instead of all O(n^2) pairs, quicksort vals by their relations, one
+    # batch per level of recursion (O(n log n) comparisons in O(log n)
+    # round trips), and let transitivity imply the rest. that only holds
+    # where the relations really are transitive, so the order is checked:
+    #  - vals are sorted twice, with different (seeded, so reproducible)
+    #    random pivots, and every pair the two orders disagree on is
+    #    compared directly
+    #  - every pair of neighbours in the order is compared directly
+    #  - operands that are == to something are compared with each other;
+    #    a cycle like () > "" == unicode() > () hides in an == between two
+    #    operands that the sort put far apart
+    # an operand caught in a contradiction, or that is neither >, == nor <
+    # a pivot, is then compared against everything so that the cycle (or
+    # whatever it is) makes it into the graph
+    profiles = {}
+    pairs = []
+    def compare(todo):
+        fresh = []
+        for x, y in todo:
+            if x != y and (x, y) not in profiles and (y, x) not in profiles:
+                profiles[(x, y)] = None
+                fresh.append((x, y))
+        for pair, profile in zip(fresh, comparisons(lang, fresh, progress, store)):
+            profiles[pair] = profile
+            pairs.append(pair)
+    def rel(x, y):
+        if (x, y) in profiles:
+            return profiles[(x, y)]
+        return flip(profiles[(y, x)])
+    def quicksort(vals, unordered, seed):
+        # returns groups of ==, in ascending order
+        rand = random.Random(seed)
+        parts = [(False, list(vals))]
+        while [seg for done, seg in parts if not done]:
+            pivots = [rand.choice(seg) for done, seg in parts]
+            compare([(pivot, x) for (done, seg), pivot in zip(parts, pivots)
+                        if not done for x in seg])
+            nparts = []
+            for (done, seg), pivot in zip(parts, pivots):
+                if done or len(seg) < 2:
+                    nparts.append((True, seg))
+                    continue
+                less, equal, greater = [], [pivot], []
+                for x in seg:
+                    if x is pivot:
+                        continue
+                    r = rel(x, pivot)
+                    if r.get('>'): greater.append(x)
+                    elif r.get('=='): equal.append(x)
+                    elif r.get('<'): less.append(x)
+                    else: unordered.add(x)
+                nparts += [(False, less), (True, equal), (False, greater)]
+            parts = [(done, seg) for done, seg in nparts if seg]
+        return [seg for done, seg in parts]
+
+    suspects = set()
+    groups = quicksort(vals, suspects, 1)
+    rank = dict((x, i) for i, seg in enumerate(groups) for x in seg)
+    rank2 = dict((x, i) for i, seg in enumerate(quicksort(vals, suspects, 2)) for x in seg)
+    chain = [x for seg in groups for x in seg]
+    compare([(x, y) for x, y in itertools.combinations(chain, 2)
+                if x in rank2 and y in rank2 and rank[x] < rank[y] and rank2[x] >= rank2[y]])
+    compare(zip(chain, chain[1:]))
+    equals = [x for seg in groups if len(seg) > 1 for x in seg]
+    compare(itertools.combinations(equals, 2))
+    for x, y in itertools.combinations(chain, 2):
+        if (x, y) not in profiles and (y, x) not in profiles:
+            continue
+        r = rel(x, y)
+        if rank[x] == rank[y]:
+            ok = r.get('==')
+        else:
+            ok = r.get('<') and not r.get('>')
+        if not ok:
+            suspects.update([x, y])
+    compare([(x, y) for x in vals if x in suspects for y in vals])
+    print '%s: %d of %d comparisons, %d suspect operands' % (
+        lang.name, len(pairs), len(vals) * (len(vals) - 1) / 2, len(suspects))
+    return pairs, [profiles[pair] for pair in pairs]
+
+def equivalence_classes(lang, vals, progress=None, store=None, probes=None):
+    # operands that relate to a handful of probes, and to themselves, in
+    # exactly the same way, grouped in order of first appearance; the first
+    # of each class stands for the rest. the probes are the first operand of
+    # each kind (lang.kind(), or the Value class where the backend can't
+    # say), kinds being what tends to make equal values relate differently
+    # to everything else (python 2 orders "" and u"" against () by type
+    # name), up to `probes` of them, the kinds with the most operands first.
+    # x ? p says what p ? x does (see flip()), so each operand costs
+    # probes + 1 comparisons (those between representatives the search
+    # needs anyway), against n - 1 each for every pair; where that doesn't
+    # come to well under, it's not worth it and every operand is a class of
+    # its own
+    n = len(vals)
+    probes = probes or max(1, (n - 1) // 8 - 1)
+    if n + (probes + 1) * n >= n * (n - 1) / 2:
+        return [[x] for x in vals]
+    known = {}
+    position = dict((str(x), i) for i, x in enumerate(vals))
+    def profiles(pairs):
+        # each pair compared once however often it's asked for, and the
+        # way round ordinality() compares it (in vals order), so that the
+        # store has it for the search proper
+        def key(x, y):
+            return (str(x), str(y)) if position[str(x)] <= position[str(y)] else (str(y), str(x))
+        todo = []
+        for x, y in pairs:
+            if key(x, y) not in known:
+                known[key(x, y)] = None
+                todo.append(sorted([x, y], key=lambda v: position[str(v)]))
+        for (x, y), profile in zip(todo, comparisons(lang, todo, progress, store)):
+            known[str(x), str(y)] = profile
+        return [known[key(x, y)] if key(x, y) == (str(x), str(y)) else flip(known[key(x, y)])
+                    for x, y in pairs]
+    if lang.kind(vals[0]) is None:
+        kinds = [x.__class__.__name__ for x in vals]
+    else:
+        kinds = run_all(lang, [bound(lang, lang.kind, x) for x in vals], progress, store)
+    kind = dict((str(x), k) for x, k in zip(vals, kinds))
+    firsts, seen = [], set()
+    for x, k in zip(vals, kinds):
+        if k not in seen:
+            seen.add(k)
+            firsts.append(x)
+    chosen = sorted(firsts, key=lambda x: -kinds.count(kind[str(x)]))[:probes]
+    found = profiles([pair for x in vals for pair in [(x, p) for p in chosen] + [(x, x)]])
+    size = len(chosen) + 1
+    classes = {}
+    order = []
+    for i, x in enumerate(vals):
+        signature = tuple(tuple(sorted(p.items())) for p in found[i * size:(i + 1) * size])
+        if signature not in classes:
+            classes[signature] = []
+            order.append(signature)
+        classes[signature].append(x)
+    # and a class only holds operands that are to its representative what
+    # the representative is to itself (so not 1j and -1j, or -1 and
+    # -sys.maxint, which the probes can't tell apart), and of another kind,
+    # relate to the first of every kind as the representative does (so not
+    # "" and bytearray(), which python 2 orders apart from other types by
+    # name); the rest start a class of their own and go round again
+    todo = [classes[signature] for signature in order]
+    classes = []
+    while todo:
+        self_profiles = profiles([(c[0], c[0]) for c in todo])
+        found = iter(profiles([(x, c[0]) for c in todo for x in c[1:]]))
+        mixed = [(c[0], x) for c in todo for x in c[1:] if kind[str(x)] != kind[str(c[0])]]
+        profiles([(y, q) for pair in mixed for y in pair for q in firsts])
+        rest = []
+        for c, same in zip(todo, self_profiles):
+            others = [x for x in c[1:] if next(found) != same or
+                          kind[str(x)] != kind[str(c[0])] and
+                              profiles([(x, q) for q in firsts]) !=
+                                  profiles([(c[0], q) for q in firsts])]
+            classes.append([x for x in c if x not in others])
+            if others:
+                rest.append(others)
+        todo = rest
+    print '%s: %d operands in %d classes, %d probes' % (
+        lang.name, len(vals), len(classes), len(chosen))
+    return classes
+
+def ordinality(lang, progress=None, store=None, strategy='all', render=True,
+               equivalence=False, nondeterminism=False, shard=None, collapse=False):
+    # with a shard, only its pairs are compared and the matrix saved has
+    # only those filled in; the graph is left for a run over the merged
+    # results (see merge())
+    if shard and (equivalence or strategy != 'all'):
+        raise Exception('ordinality: shards compare every pair, without --equivalence or sort')
+    ops = ['>', '==', '<']
     vals = list(lang.operands())
     cmp_true = []
-    if os.path.exists(lang.name + '.ord.cache'):
-        with open(lang.name + '.ord.cache') as f:
-            cmp_true = json.loads(f.read())
-    else:
-        # try every order-insensitive combination
-        for x,y in itertools.combinations(vals, 2):
-            for op in ['>', '==', '<']:
-                if lang.true() == do_run_op(x, op, y):
-                    if op == '<':
-                        x,y,op = y,x,'>'
-                    print '"%s" -> "%s" [label="%s"]' % (esc(x), esc(y), esc(op))
-                    cmp_true.append((str(x), op, str(y)))
+    store = store or ResultStore()
+    with stats.phase('evaluation'):
+        # with equivalence, only one operand of each class goes through the
+        # search proper; the members of a class are compared among
+        # themselves, and take their representative's relations with
+        # everything else
+        classes = [[x] for x in vals]
+        if equivalence:
+            classes = equivalence_classes(lang, vals, progress, store)
+        reps = [c[0] for c in classes]
+        if strategy == 'sort':
+            pairs, profiles = scheduled_comparisons(lang, reps, progress, store)
+        else:
+            # try every order-insensitive combination, in as few round trips
+            # as the backend allows; results already in the store aren't run
+            # again
+            pairs = [pair for k, pair in enumerate(itertools.combinations(reps, 2))
+                         if in_shard(k, shard)]
+            profiles = comparisons(lang, pairs, progress, store)
+        inner = [pair for c in classes for pair in itertools.combinations(c, 2)]
+        if inner:
+            profiles += comparisons(lang, inner, progress, store)
+    # pairs whose comparisons have given different answers on different
+    # runs, this time (with nondeterminism) or any time before. each operand
+    # with itself too, that being where memory addresses show through
+    exprs = dict(((str(x), str(y)), comparison_exprs(lang, x, y))
+                    for x, y in pairs + inner +
+                        [(x, x) for k, x in enumerate(vals) if in_shard(k, shard)])
+    every = list(itertools.chain.from_iterable(exprs.values()))
+    if nondeterminism:
+        with stats.phase('resampling'):
+            resample(lang, every, store)
+    seen = store.flaky(lang, every)
+    flaky = set(frozenset(pair) for pair, codes in exprs.items() if seen.intersection(codes))
+    for pair in flaky:
+        print 'flaky: %s' % ', '.join(sorted(pair))
+    # kept as codes from here on; also saved for anything that wants the
+    # whole table without rerunning (see ResultMatrix.load)
+    matrix = ResultMatrix(vals, lang.relation_ops, lang.name, lang.version)
+    members = dict((str(c[0]), c) for c in classes)
+    for (x,y), profile in zip(pairs, profiles[:len(pairs)]):
+        for a in members[str(x)]:
+            for b in members[str(y)]:
+                matrix.set_relations(a, b, profile)
+    for (x,y), profile in zip(inner, profiles[len(pairs):]):
+        matrix.set_relations(x, y, profile)
+    matrix.save(lang.name + '.ord.matrix')
+    del profiles
+    if shard:
+        return matrix
+    for x,y in inner:
+        for wat in relation_wats(matrix.relations(x, y)):
+            print 'wat: %s, %s: %s' % (x, y, wat)
+    for x,y in pairs:
+        profile = matrix.relations(x, y)
+        for wat in relation_wats(profile):
+            print 'wat: %s, %s: %s' % (x, y, wat)
+        for op in ops:
+            if profile.get(op):
+                if op == '<':
+                    x,y,op = y,x,'>'
+                cmp_true.append((str(x), op, str(y)))
+                break
+    graphviz(lang, reps, cmp_true, render, classes, flaky=flaky, collapse=collapse)
+    return matrix
+
+def chains(lang, progress=None, store=None, limit=100, path=None):
+    # intransitive chains like python's () > "" == unicode() > (), found by
+    # looking for them rather than trying every triple: the pairwise
+    # relations from ordinality() (its saved matrix, where that's for this
+    # version and operands and has every pair) make a graph with an edge x -> y for each x > y, x == y or
+    # x >= y, and a cycle through a strict (>) edge is something no total
+    # order allows. the shortest such cycle through each strict edge, of 3
+    # operands or more (2 is already a wat of the pair), is a candidate; so
+    # is the shortest run of == between two operands that are != (js's
+    # [] == 0 == "0" != []). candidates are checked as real chained
+    # expressions (lang.chain()) and those that hold are returned and
+    # written to path (<name>.chains.jsonl) shortest first
+    path = path or '%s.chains.jsonl' % lang.name
+    matrix = None
+    if os.path.exists(lang.name + '.ord.matrix'):
+        matrix = ResultMatrix.load(lang.name + '.ord.matrix')
+        # a shard's, or a sort's, has pairs missing
+        if (matrix.version != lang.version or
+                matrix.operands != [str(x) for x in lang.operands()] or matrix.gaps()):
+            matrix = None
+    if matrix is None:
+        matrix = ordinality(lang, progress, store, render=False)
+    G = nx.DiGraph()
+    for x in matrix.operands:
+        for y in matrix.operands:
+            if x == y:
+                continue
+            profile = matrix.relations(x, y)
+            for op in ['>', '==', '>=']:
+                if profile.get(op):
+                    G.add_edge(x, y, op=op)
                     break
-        with open(lang.name + '.ord.cache', 'w') as f:
-            f.write(json.dumps(cmp_true))
-    graphviz(lang, vals, cmp_true)
+    E = nx.Graph()
+    E.add_edges_from((x, y) for x, y, data in G.edges(data=True) if data['op'] == '==')
+    candidates = {}
+    for x, y, data in G.edges(data=True):
+        if data['op'] != '>':
+            continue
+        try:
+            cycle = nx.shortest_path(G, y, x)
+        except nx.NetworkXNoPath:
+            continue
+        if len(cycle) < 3:
+            continue
+        # the same cycle from wherever it was found
+        i = cycle.index(min(cycle))
+        cycle = tuple(cycle[i:] + cycle[:i])
+        candidates[cycle] = [G[a][b]['op'] for a, b in zip(cycle, cycle[1:] + cycle[:1])]
+    for x, y in itertools.combinations(matrix.operands, 2):
+        if x not in E or y not in E or not matrix.relations(x, y).get('!='):
+            continue
+        try:
+            run = nx.shortest_path(E, x, y)
+        except nx.NetworkXNoPath:
+            continue
+        if len(run) >= 3:
+            candidates[tuple(run)] = ['=='] * (len(run) - 1) + ['!=']
+    links = candidates
+    candidates = sorted(candidates, key=lambda c: (len(c), c))[:limit]
+    links = [links[c] for c in candidates]
+    exprs = [bound(lang, lambda *terms: lang.chain(list(terms) + [terms[0]], ops), *c)
+                 for c, ops in zip(candidates, links)]
+    verified = []
+    with open(path, 'w') as out:
+        for c, ops, expr, output in zip(candidates, links, exprs,
+                                        run_all(lang, exprs, progress, store)):
+            if lang.true() != output:
+                continue
+            verified.append(expr)
+            out.write(jsonl({'lang': lang.name, 'version': lang.version, 'length': len(c),
+                             'operands': list(c), 'ops': ops, 'expr': expr}))
+            print 'chain: %s' % expr
+    print '%s: %d of %d candidate chains hold' % (lang.name, len(verified), len(candidates))
+    return verified
+
+def version_diff(langs, shown=10):
+    # how ordinality changes from one version of a language to the next
+    # (see versions()), from each version's saved <name>.ord.matrix and
+    # <name>.ord.json: each pair of operands they both have whose relations
+    # differ from the first version's, and the edges of the graph a version
+    # adds to or takes away from the first's. written to
+    # <family>.versions.json, one per language; returns those
+    families = {}
+    for lang in langs:
+        if os.path.exists(lang.name + '.ord.matrix'):
+            families.setdefault(lang.family, []).append(lang)
+        else:
+            print '%s: no %s.ord.matrix to compare' % (lang.family, lang.name)
+    diffs = {}
+    for family, found in sorted(families.items()):
+        if len(found) < 2:
+            continue
+        base = found[0]
+        before = ResultMatrix.load(base.name + '.ord.matrix')
+        with open(base.name + '.ord.json') as f:
+            edges = set((e['source'], e['target'], e['op']) for e in json.load(f)['edges'])
+        diff = {'lang': family, 'versions': [lang.version for lang in found], 'changes': {}}
+        for lang in found[1:]:
+            after = ResultMatrix.load(lang.name + '.ord.matrix')
+            common = [x for x in before.operands if x in after.ids]
+            relations = []
+            for x, y in itertools.combinations(common, 2):
+                a, b = before.relations(x, y), after.relations(x, y)
+                if a != b:
+                    relations.append({'x': x, 'y': y, 'before': a, 'after': b})
+            with open(lang.name + '.ord.json') as f:
+                now = set((e['source'], e['target'], e['op']) for e in json.load(f)['edges'])
+            diff['changes'][lang.version] = {
+                'relations': relations,
+                'added': sorted(now - edges), 'removed': sorted(edges - now)}
+            print '%s %s -> %s: %d of %d pairs relate differently, %d edges added, %d removed' % (
+                family, base.version, lang.version, len(relations),
+                len(common) * (len(common) - 1) / 2, len(now - edges), len(edges - now))
+            def says(profile):
+                if not profile:
+                    return 'error'
+                errors = [op for op in lang.relation_ops if op in profile and profile[op] is None]
+                return ' '.join(op for op in lang.relation_ops if profile.get(op)) + (
+                    ' (%s raise)' % ' '.join(errors) if errors else '')
+            for r in relations[:shown]:
+                print '  %s, %s: %s -> %s' % (r['x'], r['y'], says(r['before']), says(r['after']))
+        with open(family + '.versions.json', 'w') as f:
+            json.dump(diff, f, indent=1, sort_keys=True)
+        diffs[family] = diff
+    return diffs
+
+def operation_matrix(lang, progress=None, path=None, shard=None):
+    # the whole of operations(lang) as a ResultMatrix, saved to path
+    # (<name>.ops.matrix). unary operations are the rows of the empty
+    # operand ''. a backend with a kernel() is sent the operands and
+    # operators once and works the table out itself, sending back a row of
+    # codes at a time; without one, and for any row the kernel dies on,
+    # each row goes through run_many as usual. with a shard, only its rows
+    # are filled in
+    path = path or '%s.ops.matrix' % lang.name
+    operands = [str(x) for x in lang.operands()]
+    unary = [str(op) for op in lang.unary()]
+    binary = [str(op) for op in lang.binary()]
+    rows = [('', op) for op in unary] + [(x, op) for x in operands for op in binary]
+    matrix = ResultMatrix([''] + operands, unary + [op for op in binary if op not in unary],
+                          lang.name, lang.version)
+    mine = [k for k in xrange(len(rows)) if in_shard(k, shard)]
+    if progress:
+        progress.start(lang.name, len(mine) * len(operands))
+    done = 0
+    with stats.phase('kernel'):
+        while done < len(mine):
+            # the kernel's own numbering of outputs, to ours
+            remap = range(ResultMatrix.FIRST_VALUE)
+            start = time.time()
+            try:
+                names = [lang.ref(x) for x in operands]
+                refs = [reference(lang, x) for x in operands]
+                for values, codes in lang.kernel([source(x) for x in operands], names, refs,
+                                                 unary, binary, mine[done],
+                                                 shard[1] if shard else 1) or ():
+                    remap.extend(matrix.intern(v.encode('utf-8')) for v in values)
+                    x, op = rows[mine[done]]
+                    i = matrix.index(x, op, operands[0])
+                    matrix.codes[i:i + len(codes)] = array.array(matrix.codes.typecode,
+                                                                 [remap[c] for c in codes])
+                    elapsed = time.time() - start
+                    stats.record(lang.name, len(codes), elapsed, codes.count(ResultMatrix.ERROR))
+                    # a row comes back at once, so its cells get the average
+                    stats.latency(lang.name, [elapsed / max(len(codes), 1)] * len(codes))
+                    start = time.time()
+                    if progress:
+                        progress.advance(lang.name, len(codes))
+                    done += 1
+            except Crash:
+                pass
+            if done < len(mine):
+                x, op = rows[mine[done]]
+                outputs = stats.run(lang, [operation(lang, x, op, y) for y in operands])
+                for y, output in zip(operands, outputs):
+                    matrix.set(x, op, y, matrix.code(lang, output))
+                if progress:
+                    progress.advance(lang.name, len(outputs))
+                done += 1
+    matrix.save(path)
+    return matrix
+
+def jsonl(record):
+    # one line of JSON; outputs are whatever bytes the interpreter printed
+    def text(v):
+        if isinstance(v, dict):
+            return dict((k, text(x)) for k, x in v.items())
+        if isinstance(v, str):
+            return v.decode('utf-8', 'replace')
+        return v
+    return json.dumps(text(record), sort_keys=True) + '\n'
+
+def scan(lang, progress=None, store=None, path=None, offset=None, interval=10, shard=None):
+    # stream every operation through the backend a few batches at a time,
+    # appending the interesting ones to path as JSON lines. nothing is kept
+    # but the current step, and the offset reached is saved after each one
+    # (path.offset) so a rerun carries on from there unless told otherwise,
+    # dropping whatever records it has past there.
+    # with a shard, only its operations are run; offsets are still counted
+    # over all of them
+    path = path or '%s.scan.jsonl' % lang.name
+    if offset is None:
+        offset = 0
+        if os.path.exists(path + '.offset'):
+            with open(path + '.offset') as f:
+                offset = int(f.read() or 0)
+    if os.path.exists(path):
+        # records past the offset are from a step that never finished (or
+        # half-written, if it was killed mid-line); that step is run again
+        def before(line):
+            try:
+                return line.endswith('\n') and json.loads(line)['offset'] < offset
+            except ValueError:
+                return False
+        with open(path) as f, open(path + '.tmp', 'w') as out:
+            out.writelines(line for line in f if before(line))
+        os.rename(path + '.tmp', path)
+    total = count_operations(lang)
+    if progress:
+        progress.start(lang.name, sum(1 for k in xrange(offset, total) if in_shard(k, shard)))
+    codes = ((k, code) for k, code in itertools.islice(enumerate(operations(lang)), offset, None)
+                if in_shard(k, shard))
+    step = lang.batch_size * 10
+    found = 0
+    began, shown = time.time(), time.time()
+    with open(path, 'a') as out:
+        while True:
+            chunk = list(itertools.islice(codes, step))
+            if not chunk:
+                break
+            offsets, chunk = zip(*chunk)
+            for k, code, output in zip(offsets, chunk, run_all(lang, chunk, store=store)):
+                if is_interesting({lang.name: classify(lang, output)}):
+                    out.write(jsonl({'offset': k, 'expr': code, 'output': output}))
+                    found += 1
+            offset = offsets[-1] + 1
+            out.flush()
+            with open(path + '.offset.tmp', 'w') as f:
+                f.write('%d' % offset)
+            os.rename(path + '.offset.tmp', path + '.offset')
+            if progress:
+                progress.advance(lang.name, len(chunk))
+            elif time.time() - shown >= interval:
+                shown = time.time()
+                print '%s scan %d/%d %.0f/s, %d interesting' % (
+                    lang.name, offset, total, offset / (shown - began), found)
+    return found
+
+def merge(dirs, db='wat.db', names=None):
+    # put the results of a sharded run (see in_shard()) back together, here,
+    # from the directories each shard ran in: the stores, <name>.ord.matrix,
+    # <name>.ops.matrix and <name>.scan.jsonl. every shard of a run must be
+    # there, once, finished, and on the same version of the language as the
+    # rest; results two shards both have must agree. anything else is an
+    # error, after everything that could be merged has been
+    problems = []
+    runs = {}
+    for d in dirs:
+        for lang, version, mode, shard, shards, done in ResultStore(os.path.join(d, db)).shards():
+            if names and lang not in names:
+                continue
+            runs.setdefault((lang, mode), []).append((version, shard, shards, done, d))
+    if not runs:
+        raise Exception('merge: no sharded runs in %s' % ', '.join(dirs))
+    versions = {}
+    for (lang, mode), found in sorted(runs.items()):
+        versions.setdefault(lang, set()).update(version for version, _, _, _, _ in found)
+        counts = set(shards for _, _, shards, _, _ in found)
+        if len(counts) > 1:
+            problems.append('%s %s: shards of %s runs' % (
+                lang, mode, ', '.join(str(n) for n in sorted(counts))))
+            continue
+        n, = counts
+        have = sorted(shard for _, shard, _, _, _ in found)
+        for shard in sorted(set(have)):
+            if have.count(shard) > 1:
+                problems.append('%s %s: shard %d of %d is in %s' % (lang, mode, shard, n, ', '.join(
+                    d for _, i, _, _, d in found if i == shard)))
+        for shard in sorted(set(xrange(n)) - set(have)):
+            problems.append('%s %s: shard %d of %d is missing' % (lang, mode, shard, n))
+        for _, shard, _, done, d in found:
+            if not done:
+                problems.append('%s %s: shard %d of %d in %s never finished' % (lang, mode, shard, n, d))
+    for lang, vs in sorted(versions.items()):
+        if len(vs) > 1:
+            problems.append('%s: shards on versions %s' % (lang, ', '.join(sorted(vs))))
+
+    store = ResultStore(db)
+    for d in dirs:
+        same, conflicts = store.merge(os.path.join(d, db))
+        if same:
+            print 'merge: %d results from %s were already here' % (same, d)
+        for expr, ours, theirs in conflicts[:10]:
+            print 'merge: %s: %s here, %s in %s' % (expr, ours, theirs, d)
+        if conflicts:
+            problems.append('%s: %d results disagree with another shard' % (d, len(conflicts)))
+
+    for lang in sorted(versions):
+        def ran(mode):
+            return [d for _, _, _, _, d in runs.get((lang, mode), [])]
+        for mode, suffix in [('ordinality', '.ord.matrix'), ('matrix', '.ops.matrix')]:
+            matrix = None
+            for d in ran(mode):
+                path = os.path.join(d, lang + suffix)
+                if not os.path.exists(path):
+                    problems.append('%s: missing' % path)
+                    continue
+                part = ResultMatrix.load(path)
+                if matrix is None:
+                    matrix = ResultMatrix(part.operands, part.ops, part.lang, part.version)
+                try:
+                    same, conflicts = matrix.merge(part)
+                except Exception, e:
+                    problems.append('%s: %s' % (path, e))
+                    continue
+                if same:
+                    problems.append('%s: %d results another shard has too' % (path, same))
+                if conflicts:
+                    problems.append('%s: %d results another shard disagrees with' % (
+                        path, len(conflicts)))
+            if matrix is None:
+                continue
+            if mode == 'ordinality':
+                # every pair is compared, so only x ? x is left out
+                gaps = matrix.gaps()
+                if gaps:
+                    problems.append('%s%s: %d comparisons missing' % (lang, suffix, gaps))
+            matrix.save(lang + suffix)
+        if ran('scan'):
+            records = {}
+            offset = 0
+            for d in ran('scan'):
+                path = os.path.join(d, lang + '.scan.jsonl')
+                if not os.path.exists(path + '.offset'):
+                    problems.append('%s: missing' % path)
+                    continue
+                with open(path + '.offset') as f:
+                    offset = max(offset, int(f.read() or 0))
+                dups = 0
+                with open(path) as f:
+                    for line in f:
+                        k = json.loads(line)['offset']
+                        dups += k in records
+                        records[k] = line
+                if dups:
+                    problems.append('%s: %d offsets another shard has too' % (path, dups))
+            with open(lang + '.scan.jsonl', 'w') as out:
+                for k in sorted(records):
+                    out.write(records[k])
+            with open(lang + '.scan.jsonl.offset', 'w') as f:
+                f.write('%d' % offset)
+
+    for problem in problems:
+        print 'merge: %s' % problem
+    if problems:
+        raise Exception('merge: %d problems' % len(problems))
+
+def type_table(lang, store, path=None):
+    # what each operator gives for each pair of operand types, from the
+    # results of operations(lang) that the store already has (a scan's):
+    # nothing is run. operand types are those of lang.operands(), results
+    # those the backend gave (see Lang.value()). a count of result types for
+    # each (operator, left type, right type), the left being '' for unary
+    # operators, is written to path (<name>.types.json) and returned; those
+    # that raise are listed
+    path = path or '%s.types.json' % lang.name
+    names = dict((code, name) for name, code in vars(Types).items() if not name.startswith('_'))
+    operands = lang.operands()
+    keys = [(op, '', y) for op in lang.unary() for y in operands] + \
+           [(op, x, y) for x in operands for op in lang.binary() for y in operands]
+    # as operations() has them, and the store keeps them: by their source
+    codes = [' '.join([op, source(y)]) if x == '' else ' '.join([source(x), op, source(y)])
+                 for op, x, y in keys]
+    found = store.get_many(lang, codes)
+    table = {}
+    for (op, x, y), code in zip(keys, codes):
+        if code not in found:
+            continue
+        key = (op, names[x.type] if x != '' else '', names[y.type])
+        counts = table.setdefault(key, {})
+        result = names[lang.value(found[code]).type]
+        counts[result] = counts.get(result, 0) + 1
+    print '%s: %d of %d operations in the store' % (lang.name, len(found), len(codes))
+    for (op, x, y), counts in sorted(table.items()):
+        errors = sum(n for result, n in counts.items() if result.startswith('ERR_'))
+        if errors:
+            print '%-4s %-10s %-10s %d of %d raise (%s)' % (op, x, y, errors, sum(counts.values()),
+                ', '.join('%s %d' % (r, n) for r, n in sorted(counts.items())))
+    with open(path, 'w') as f:
+        json.dump([{'op': op, 'x': x, 'y': y, 'results': counts}
+                       for (op, x, y), counts in sorted(table.items())], f, indent=1)
+    return table
+
+def normalize(lang, output):
+    # enough to compare outputs across languages: errors and nothing are
+    # classified as usual and booleans lose their capitals
+    output = classify(lang, output)
+    if lang.value(output).type == Types.BOOL:
+        output = output.lower()
+    return output
 
-ordinality(Javascript())
-ordinality(Python())
+def differential(langs, codes, path='diff.jsonl', depth=4, top=50):
+    # run one stream of expressions through several backends at once and
+    # report where they disagree. each backend works through the stream in
+    # a thread of its own, up to `depth` steps ahead of the slowest, so the
+    # whole thing takes about as long as the slowest language rather than
+    # the sum of them all. every disagreement (with at least one output
+    # that isn't an error or nothing) is appended to path as it's found;
+    # the `top` ranked by how many different answers there were are
+    # returned, and kept in a heap meanwhile
+    step = max(lang.batch_size for lang in langs) * 10
+    inqs = [Queue.Queue(depth) for lang in langs]
+    outqs = [Queue.Queue(depth) for lang in langs]
+    pending = Queue.Queue()
+    def feed():
+        codes_ = iter(codes)
+        while True:
+            # as text: the names operands are bound to are each backend's own
+            chunk = [str(code) for code in itertools.islice(codes_, step)]
+            pending.put(chunk)
+            for q in inqs:
+                q.put(chunk)
+            if not chunk:
+                return
+    def work(lang, inq, outq):
+        while True:
+            chunk = inq.get()
+            try:
+                outq.put(run_all(lang, chunk) if chunk else None)
+            except Exception, e:
+                outq.put(e)
+                return
+            if not chunk:
+                return
+    threads = [threading.Thread(target=feed)] + [
+        threading.Thread(target=work, args=args) for args in zip(langs, inqs, outqs)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    ranked = []
+    offset = 0
+    with open(path, 'a') as out:
+        while True:
+            chunk = pending.get()
+            results = [q.get() for q in outqs]
+            for r in results:
+                if isinstance(r, Exception):
+                    raise r
+            if not chunk:
+                break
+            for i, code in enumerate(chunk):
+                outputs = dict((lang.name, r[i]) for lang, r in zip(langs, results))
+                norm = set(normalize(lang, r[i]) for lang, r in zip(langs, results))
+                if len(norm) > 1 and norm - BoringResults:
+                    out.write(jsonl({'offset': offset + i, 'expr': code,
+                                     'distinct': len(norm), 'outputs': outputs}))
+                    heapq.heappush(ranked, (len(norm), -(offset + i), code, outputs))
+                    if len(ranked) > top:
+                        heapq.heappop(ranked)
+            out.flush()
+            offset += len(chunk)
+    ranked = sorted(ranked, reverse=True)
+    for distinct, neg_offset, code, outputs in ranked:
+        print '%6d %-20s %s' % (-neg_offset, code, ' '.join(
+            '%s %-22s' % (name, outputs[name]) for name in sorted(outputs)))
+    return [(code, outputs) for distinct, neg_offset, code, outputs in ranked]
+
+def shard_arg(text):
+    # "i/n" on the command line
+    try:
+        i, n = [int(x) for x in text.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected I/N, like 0/4')
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError('shard %d of %d: I goes from 0 to N-1' % (i, n))
+    return (i, n)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='find the wat in built-in operators')
+    parser.add_argument('langs', nargs='*', choices=sorted(lang_classes) + [[]],
+                        help='languages to run (default: %s)' % ' '.join(cls.name for cls in langs))
+    parser.add_argument('-m', '--mode', default='ordinality',
+                        choices=['ordinality', 'chains', 'scan', 'matrix', 'diff', 'merge',
+                                 'versions', 'types'],
+                        help='ordinality graph, intransitive chains, scan of every '
+                             'operation, the operation matrix, differences between '
+                             'the languages, merge sharded results, ordinality '
+                             'compared between versions (see -x), or what each '
+                             'operator does to each type, from a scan')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='interpreters per language')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='languages to run at once (default: all)')
+    parser.add_argument('-o', '--output-dir', help='write everything here (default: .)')
+    parser.add_argument('--db', default='wat.db', help='results kept between runs')
+    parser.add_argument('-x', '--executable', action='append', default=[], metavar='LANG=EXE',
+                        help='run LANG with interpreter EXE; give several for several versions')
+    parser.add_argument('--strategy', choices=['all', 'sort'], default='all',
+                        help='ordinality: compare every pair, or sort and check')
+    parser.add_argument('--equivalence', action='store_true',
+                        help='ordinality: search one operand of each equivalence class')
+    parser.add_argument('--nondeterminism', action='store_true',
+                        help='ordinality: rerun comparisons on fresh interpreters to find flaky ones')
+    parser.add_argument('--collapse', action='store_true',
+                        help='ordinality: draw each cycle as one node listing its members')
+    parser.add_argument('--no-render', dest='render', action='store_false',
+                        help="ordinality: write the graph but don't run dot")
+    parser.add_argument('--shard', type=shard_arg, metavar='I/N',
+                        help='ordinality, scan, matrix: do shard I (from 0) of N')
+    parser.add_argument('--from', dest='sources', nargs='+', metavar='DIR', default=[],
+                        help='merge: the directories the shards ran in')
+    parser.add_argument('--stats', default='wat.stats.json', help='where to dump run stats')
+    parser.add_argument('--interval', type=int, default=10,
+                        help='seconds between progress reports')
+    args = parser.parse_args()
+    if args.shard and args.mode not in ('ordinality', 'scan', 'matrix'):
+        parser.error('--shard is for ordinality, scan and matrix')
+    if args.mode == 'merge' and not args.sources:
+        parser.error('merge needs --from')
+    sources = [os.path.abspath(d) for d in args.sources]
+    executables = {}
+    for x in args.executable:
+        name, _, exe = x.partition('=')
+        if name not in lang_classes or not exe:
+            parser.error('-x %s: expected LANG=EXE, LANG one of %s' % (
+                x, ' '.join(sorted(lang_classes))))
+        executables.setdefault(name, []).append(exe)
+    classes = [lang_classes[name] for name in args.langs or sorted(executables)] or langs
+    classes = sum([versions(cls, executables[cls.name]) if cls.name in executables else [cls]
+                       for cls in classes], [])
+    # every mode but merge builds its expressions from operands(), which
+    # only some backends have; diff only needs them of its first language
+    needs = [] if args.mode == 'merge' else classes[:1] if args.mode == 'diff' else classes
+    missing = [cls.name for cls in needs if not hasattr(cls, 'operands')]
+    if missing:
+        parser.error('%s: no operands to run %s with (these can only follow another '
+                     'language in diff)' % (' '.join(missing), args.mode))
+    if args.output_dir:
+        if not os.path.isdir(args.output_dir):
+            os.makedirs(args.output_dir)
+        os.chdir(args.output_dir)
+    atexit.register(stats.dump, args.stats)
+    if args.mode == 'merge':
+        merge(sources, args.db, args.langs)
+        sys.exit(0)
+    store = ResultStore(args.db)
+    if args.mode == 'diff':
+        differential([backend(cls, args.workers) for cls in classes],
+                     operations(backend(classes[0], args.workers)))
+    else:
+        task = {
+            'ordinality': lambda lang, progress: ordinality(lang, progress, store, args.strategy,
+                                                            args.render, args.equivalence,
+                                                            args.nondeterminism, args.shard,
+                                                            args.collapse),
+            'chains': lambda lang, progress: chains(lang, progress, store),
+            'scan': lambda lang, progress: scan(lang, progress, store, interval=args.interval,
+                                                shard=args.shard),
+            'matrix': lambda lang, progress: operation_matrix(lang, progress, shard=args.shard),
+            'versions': lambda lang, progress: ordinality(lang, progress, store,
+                                                          render=args.render),
+            'types': lambda lang, progress: type_table(lang, store),
+        }[args.mode]
+        if args.shard:
+            # noted in the store, for merge() to check the shards against
+            def sharded(lang, progress, task=task):
+                store.set_shard(lang, args.mode, args.shard, False)
+                task(lang, progress)
+                store.set_shard(lang, args.mode, args.shard, True)
+            task = sharded
+        progress = orchestrate(classes, [task], args.jobs, args.interval, args.workers)
+        if args.mode == 'versions':
+            version_diff([backend(cls, args.workers) for cls in classes])
+        if progress.failed():
+            sys.exit(1)
 